@@ -0,0 +1,62 @@
+import copy
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Маршруты чтения, которые под ASGI обслуживаются асинхронно.
+ASYNC_ROUTES = {
+    'recipes-list', 'recipes-detail', 'tags-list', 'tags-detail',
+    'ingredients-list', 'ingredients-detail', 'users-subscriptions',
+}
+
+
+def read_in_thread(view):
+    """Выполняет представление так же, как его выполнил бы WSGI-поток:
+    соединения с базой закрываются по CONN_MAX_AGE до и после запроса."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+def async_read_view(view):
+    """Асинхронная обёртка над представлением DRF.
+
+    В Django 3.2 нет асинхронного ORM, поэтому запросы к базе,
+    фильтрация и сериализация по-прежнему синхронные. Безопасные
+    запросы выполняются одним переходом в общий пул потоков
+    (thread_sensitive=False) и могут идти параллельно, а цикл событий
+    тем временем обслуживает медленных клиентов. Запись идёт обычным
+    путём Django для синхронных представлений.
+    """
+    read = sync_to_async(read_in_thread(view), thread_sensitive=False)
+    write = sync_to_async(view)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+    return wrapper
+
+
+def make_async(patterns):
+    """Копия маршрутов, где представления ASYNC_ROUTES асинхронные.
+
+    Исходные маршруты не меняются, поэтому одни и те же маршруты
+    роутера можно подключить и синхронно, и асинхронно.
+    """
+    result = []
+    for pattern in patterns:
+        if getattr(pattern, 'name', None) in ASYNC_ROUTES:
+            pattern = copy.copy(pattern)
+            pattern.callback = async_read_view(pattern.callback)
+        result.append(pattern)
+    return result
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def token_key(key):
+    return f'auth:token:{key}'
+
+
+class LocalCache:
+    """Небольшой LRU-кеш процесса с коротким временем жизни записей.
+
+    Другие процессы не могут его сбросить, поэтому TTL должен быть
+    заметно меньше, чем у общего кеша.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+
+LOCAL = LocalCache(
+    settings.TOKEN_AUTH_LOCAL_CACHE_SIZE, settings.TOKEN_AUTH_LOCAL_TTL
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, которая хранит пользователя по ключу токена
+    в кеше и не ходит в базу на каждый запрос.
+
+    При TOKEN_AUTH_LOCAL_CACHE_SIZE > 0 перед общим кешем работает
+    LRU-кеш процесса, при TOKEN_AUTH_CACHE_TTL = 0 общий кеш не
+    используется. Хеш пароля в кеш не попадает: поле становится
+    отложенным и читается из базы, только когда оно нужно, например
+    при смене пароля.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_key(key)
+        user = LOCAL.get(cache_key) if LOCAL.size else None
+        ttl = settings.TOKEN_AUTH_CACHE_TTL
+        if user is None:
+            user = cache.get(cache_key) if ttl else None
+            if user is None:
+                user, token = super().authenticate_credentials(key)
+                user.__dict__.pop('password', None)
+                if ttl:
+                    cache.set(cache_key, user, ttl)
+            if LOCAL.size:
+                LOCAL.set(cache_key, user)
+        return user, Token(key=key, user=user)
+
+
+def invalidate_tokens(keys):
+    keys = [token_key(key) for key in keys]
+
+    def delete():
+        cache.delete_many(keys)
+        LOCAL.delete_many(keys)
+
+    LOCAL.delete_many(keys)
+    transaction.on_commit(delete)
+
+
+def invalidate_user(user):
+    invalidate_tokens(
+        Token.objects.filter(user=user).values_list('key', flat=True)
+    )
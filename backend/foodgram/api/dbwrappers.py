@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+WRAPPERS = ContextVar('execute_wrappers', default=())
+
+
+def dispatch(execute, sql, params, many, context):
+    """Постоянная обёртка соединения: вызывает обёртки, включённые
+    execute_wrapper в контексте текущего запроса."""
+    alias = context['connection'].alias
+    for using, wrapper in reversed(WRAPPERS.get()):
+        if using is None or using == alias:
+            execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def execute_wrapper(wrapper, using=None):
+    """Аналог connection.execute_wrapper для всех соединений потока или
+    только для using.
+
+    Обёртка живёт в contextvars, поэтому действует и в потоках, где
+    sync_to_async выполняет код асинхронных представлений, а
+    connection.execute_wrapper подключается к соединению одного потока.
+    """
+    token = WRAPPERS.set(WRAPPERS.get() + ((using, wrapper),))
+    try:
+        yield
+    finally:
+        WRAPPERS.reset(token)
+
+
+def install(connection):
+    # В начало списка: connection.execute_wrapper снимает обёртку через
+    # pop(), и соединение может открыться внутри его блока.
+    if dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, dispatch)
@@ -0,0 +1,225 @@
+import csv
+import io
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from fontTools import subset
+from PIL import ImageFont
+
+TITLE = 'Список покупок'
+
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 12
+PDF_LEADING = 16
+PDF_LINES_PER_PAGE = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+PDF_ENCODING = 'cp1251'
+PDF_FIRST_CODE = 0x20
+PDF_FIRST_PAGE_OBJECT = 7
+# Метка подмножества шрифта: шесть заглавных букв перед именем.
+PDF_SUBSET_TAG = b'FOODGR+'
+
+
+def shopping_cart_rows(ingredients):
+    for ingredient in ingredients:
+        yield (ingredient['ingredients__name'],
+               ingredient['ingredients_amount'],
+               ingredient['ingredients__measurement_unit'])
+
+
+def export_txt(ingredients):
+    yield f'{TITLE}:\n'
+    for name, amount, unit in shopping_cart_rows(ingredients):
+        yield f'\n{name} - {amount}, {unit}'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in shopping_cart_rows(ingredients):
+        yield writer.writerow(row)
+
+
+def pdf_string(text):
+    data = text.encode(PDF_ENCODING, errors='replace')
+    data = data.replace(b'\\', b'\\\\').replace(b'(', b'\\(')
+    return b'(' + data.replace(b')', b'\\)') + b')'
+
+
+def pdf_encoding_table():
+    for code in range(PDF_FIRST_CODE, 0x100):
+        try:
+            yield code, ord(bytes((code,)).decode(PDF_ENCODING))
+        except UnicodeDecodeError:
+            continue
+
+
+def pdf_differences():
+    return ' '.join(
+        f'{code} /uni{char:04X}'
+        for code, char in pdf_encoding_table() if code >= 0x80
+    ).encode()
+
+
+def pdf_to_unicode():
+    mapping = [f'<{code:02X}> <{char:04X}>'
+               for code, char in pdf_encoding_table()]
+    chunks = [
+        '/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+        '/CMapName /Foodgram-CP1251 def /CMapType 2 def',
+        '1 begincodespacerange <00> <FF> endcodespacerange',
+    ]
+    for start in range(0, len(mapping), 100):
+        part = mapping[start:start + 100]
+        chunks.append(f'{len(part)} beginbfchar')
+        chunks.extend(part)
+        chunks.append('endbfchar')
+    chunks.append('endcmap CMapName currentdict /CMap defineresource pop '
+                  'end end')
+    return '\n'.join(chunks).encode()
+
+
+def subset_font(path, chars):
+    """Файл TrueType только с глифами символов chars, без хинтинга и
+    таблиц, которые не нужны программам просмотра PDF."""
+    options = subset.Options()
+    options.hinting = False
+    options.layout_features = []
+    options.notdef_outline = True
+    options.drop_tables += ['FFTM', 'GDEF', 'GPOS', 'GSUB', 'MATH']
+    font = subset.load_font(path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=chars)
+    subsetter.subset(font)
+    buffer = io.BytesIO()
+    subset.save_font(font, buffer, options)
+    return buffer.getvalue()
+
+
+@lru_cache()
+def pdf_font():
+    """Объекты шрифта PDF_FONT_PATH: словарь шрифта, дескриптор и
+    сжатый файл TrueType.
+
+    Стандартный Helvetica не содержит кириллицы, и без встроенного
+    шрифта её отрисовка зависела бы от подстановки в программе
+    просмотра. Встраивается только подмножество глифов кодировки
+    PDF_ENCODING, которое строится один раз на процесс.
+    """
+    path = settings.PDF_FONT_PATH
+    chars = dict(pdf_encoding_table())
+    data = subset_font(path, chars.values())
+    font = ImageFont.truetype(path, 1000)
+    ascent, descent = font.getmetrics()
+    widths = [
+        round(font.getlength(chr(chars[code]))) if code in chars else 0
+        for code in range(PDF_FIRST_CODE, 0x100)
+    ]
+    boxes = [font.getbbox(chr(char)) for char in chars.values()]
+    name = PDF_SUBSET_TAG + font.getname()[0].replace(' ', '').encode()
+    compressed = zlib.compress(data)
+    return (
+        b'<< /Type /Font /Subtype /TrueType /BaseFont /' + name
+        + b' /FirstChar %d /LastChar 255 /Widths [%s] /FontDescriptor '
+        b'5 0 R /Encoding << /Type /Encoding /BaseEncoding '
+        b'/WinAnsiEncoding /Differences [' % (
+            PDF_FIRST_CODE, b' '.join(b'%d' % width for width in widths)
+        ) + pdf_differences() + b'] >> /ToUnicode 4 0 R >>',
+        b'<< /Type /FontDescriptor /FontName /' + name
+        + b' /Flags 32 /FontBBox [%d %d %d %d] /ItalicAngle 0 /Ascent %d '
+        b'/Descent %d /CapHeight %d /StemV 80 /FontFile2 6 0 R >>' % (
+            min(box[0] for box in boxes), -descent,
+            max(box[2] for box in boxes), ascent, ascent, -descent,
+            ascent,
+        ),
+        b'<< /Length %d /Length1 %d /Filter /FlateDecode >>\nstream\n' % (
+            len(compressed), len(data)
+        ) + compressed + b'\nendstream',
+    )
+
+
+def export_pdf(ingredients):
+    """Отдаёт PDF постранично: объекты пишутся по мере готовности
+    страниц, а дерево страниц и таблица xref добавляются в конце."""
+    offsets = {}
+    position = 0
+
+    def write_object(number, body):
+        nonlocal position
+        offsets[number] = position
+        chunk = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        position += len(chunk)
+        return chunk
+
+    def write_page(number, lines):
+        commands = [
+            b'BT /F1 %d Tf %d TL %d %d Td' % (
+                PDF_FONT_SIZE, PDF_LEADING,
+                PDF_MARGIN, PDF_PAGE_HEIGHT - PDF_MARGIN,
+            )
+        ]
+        commands.extend(pdf_string(line) + b" '" for line in lines)
+        commands.append(b'ET')
+        content = b'\n'.join(commands)
+        return write_object(
+            number,
+            b'<< /Length %d >>\nstream\n' % len(content)
+            + content + b'\nendstream'
+        ) + write_object(
+            number + 1,
+            b'<< /Type /Page /Parent 2 0 R /Resources << /Font '
+            b'<< /F1 3 0 R >> >> /MediaBox [0 0 %d %d] /Contents %d 0 R >>'
+            % (PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, number)
+        )
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    yield header
+    yield write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    font, descriptor, font_file = pdf_font()
+    yield write_object(3, font)
+    to_unicode = pdf_to_unicode()
+    yield write_object(
+        4,
+        b'<< /Length %d >>\nstream\n' % len(to_unicode)
+        + to_unicode + b'\nendstream'
+    )
+    yield write_object(5, descriptor)
+    yield write_object(6, font_file)
+    pages = []
+    lines = [f'{TITLE}:', '']
+    for name, amount, unit in shopping_cart_rows(ingredients):
+        lines.append(f'{name} - {amount}, {unit}')
+        if len(lines) == PDF_LINES_PER_PAGE:
+            pages.append(PDF_FIRST_PAGE_OBJECT + 2 * len(pages))
+            yield write_page(pages[-1], lines)
+            lines = []
+    if lines or not pages:
+        pages.append(PDF_FIRST_PAGE_OBJECT + 2 * len(pages))
+        yield write_page(pages[-1], lines)
+    kids = b' '.join(b'%d 0 R' % (number + 1) for number in pages)
+    yield write_object(
+        2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(pages))
+    )
+    size = max(offsets) + 1
+    xref = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+    xref.extend(b'%010d 00000 n \n' % offsets[number]
+                for number in range(1, size))
+    yield b''.join(xref) + (
+        b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+        % (size, position)
+    )
+
+
+EXPORTS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8'),
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'pdf': (export_pdf, 'application/pdf'),
+}
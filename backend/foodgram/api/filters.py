@@ -1,12 +1,23 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes import fulltext
+from recipes.models import Favorite, Recipe, ShoppingList
+
+from .snapshots import snapshot_rows
+
+TAGS_MODES = (('any', 'any'), ('all', 'all'))
+
+
+def tag_choices():
+    return [(tag['slug'], tag['name']) for tag in snapshot_rows('tags')]
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='get_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES, method='get_tags_mode'
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -14,28 +25,47 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.OrderingFilter(
+        fields=(('favorites_count', 'popular'), ('pub_date', 'pub_date')),
+    )
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним (tags_mode=any) или со всеми
+        (tags_mode=all) тегами; слаги переводятся в id по снимку тегов."""
+        ids = {tag['slug']: tag['id'] for tag in snapshot_rows('tags')}
+        tag_ids = [ids[slug] for slug in value]
+        recipe_tags = Recipe.tags.through.objects
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            for tag_id in tag_ids:
+                queryset = queryset.filter(Exists(recipe_tags.filter(
+                    recipe=OuterRef('pk'), tag_id=tag_id
+                )))
+            return queryset
+        return queryset.filter(Exists(recipe_tags.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_ids
+        )))
+
+    def get_tags_mode(self, queryset, name, value):
+        return queryset
+
+    def get_search(self, queryset, name, value):
+        return fulltext.search(queryset, value)
+
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorite__user=self.request.user)
+            return queryset.filter(id__in=Favorite.objects.filter(
+                user=self.request.user
+            ).values('recipe_id'))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(lists__user=self.request.user)
+            return queryset.filter(id__in=ShoppingList.objects.filter(
+                user=self.request.user
+            ).values('recipe_id'))
         return queryset
-
-
-class IngredientsFilter(FilterSet):
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='icontains',
-    )
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
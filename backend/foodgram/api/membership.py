@@ -0,0 +1,96 @@
+import hashlib
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from recipes.models import Favorite, Follow, ShoppingList
+
+SOURCES = {
+    'favorites': (Favorite, 'recipe_id'),
+    'cart': (ShoppingList, 'recipe_id'),
+    'following': (Follow, 'author_id'),
+}
+
+STATS = {
+    'hits': 0,
+    'misses': 0,
+    'sizes': {kind: {'count': 0, 'total': 0, 'max': 0} for kind in SOURCES},
+}
+
+
+def membership_key(user_id, kind):
+    return f'membership:{kind}:{user_id}'
+
+
+class Membership:
+    """Множества id избранных рецептов, рецептов в корзине и авторов,
+    на которых подписан пользователь.
+
+    Каждое множество хранится в кеше как отсортированный массив int64 и
+    загружается из базы одним запросом при промахе. При
+    MEMBERSHIP_CACHE_TTL = 0 кеш не используется.
+    """
+
+    def __init__(self, user):
+        keys = {kind: membership_key(user.id, kind) for kind in SOURCES}
+        ttl = settings.MEMBERSHIP_CACHE_TTL
+        cached = cache.get_many(keys.values()) if ttl else {}
+        digest = hashlib.sha1()
+        for kind, key in keys.items():
+            packed = cached.get(key)
+            if packed is None:
+                STATS['misses'] += 1
+                model, field = SOURCES[kind]
+                ids = model.objects.filter(user=user).order_by(
+                    field
+                ).values_list(field, flat=True)
+                packed = array('q', ids).tobytes()
+                if ttl:
+                    cache.set(key, packed, ttl)
+            else:
+                STATS['hits'] += 1
+            ids = array('q')
+            ids.frombytes(packed)
+            self.record_size(kind, len(ids))
+            setattr(self, kind, frozenset(ids))
+            digest.update(packed)
+        self.digest = digest.hexdigest()
+
+    @staticmethod
+    def record_size(kind, size):
+        sizes = STATS['sizes'][kind]
+        sizes['count'] += 1
+        sizes['total'] += size
+        sizes['max'] = max(sizes['max'], size)
+
+    @classmethod
+    def for_request(cls, request):
+        """Возвращает множества пользователя запроса или None для
+        анонимного пользователя; результат запоминается на запросе."""
+        if request is None or request.user.is_anonymous:
+            return None
+        if not hasattr(request, '_membership'):
+            request._membership = cls(request.user)
+        return request._membership
+
+
+def invalidate(user, *kinds):
+    keys = [membership_key(user.id, kind) for kind in kinds]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def membership_stats():
+    lookups = STATS['hits'] + STATS['misses']
+    return {
+        'hits': STATS['hits'],
+        'misses': STATS['misses'],
+        'hit_rate': STATS['hits'] / lookups if lookups else None,
+        'sizes': {
+            kind: {
+                'max': sizes['max'],
+                'mean': sizes['total'] / sizes['count']
+                if sizes['count'] else None,
+            } for kind, sizes in STATS['sizes'].items()
+        },
+    }
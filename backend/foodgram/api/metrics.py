@@ -0,0 +1,207 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from .dbwrappers import execute_wrapper
+from .membership import membership_stats
+
+logger = logging.getLogger('foodgram.performance')
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PHASES = ('db', 'app', 'render')
+
+ROUTES = {}
+LOCK = threading.Lock()
+
+
+class RouteStats:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.requests = {}
+        self.seconds = dict.fromkeys(PHASES + ('total',), 0.0)
+        self.queries = 0
+
+    def observe(self, timing, status_code):
+        self.buckets[bisect.bisect_left(BUCKETS, timing.total)] += 1
+        status_class = f'{status_code // 100}xx'
+        self.requests[status_class] = self.requests.get(status_class, 0) + 1
+        for phase in PHASES:
+            self.seconds[phase] += getattr(timing, phase)
+        self.seconds['total'] += timing.total
+        self.queries += timing.queries
+
+
+class RequestTiming:
+    """Время одного запроса по фазам, в секундах.
+
+    db — выполнение SQL, render — отрисовка ответа, app — остальное
+    время представления: для DRF это в основном сериализация.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.render = 0.0
+        self.render_started = None
+        self.total = 0.0
+
+    @property
+    def app(self):
+        return max(self.total - self.db - self.render, 0.0)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.db += duration
+            self.queries += 1
+            if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+                logger.warning(
+                    'Медленный запрос %.1f мс (%s): %s',
+                    duration * 1000, route_name(self.request), sql,
+                )
+
+    def header(self):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'app;dur={self.app * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+def route_name(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.view_name
+
+
+class ServerTimingMiddleware(MiddlewareMixin):
+    """Замеряет время базы, представления и отрисовки ответа, отдаёт
+    его в заголовке Server-Timing и копит гистограммы по маршрутам."""
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timing = RequestTiming(request)
+        request._timing = timing
+        with execute_wrapper(timing):
+            response = self.get_response(request)
+        return self.finish(request, timing, response)
+
+    async def __acall__(self, request):
+        timing = RequestTiming(request)
+        request._timing = timing
+        with execute_wrapper(timing):
+            response = await self.get_response(request)
+        return self.finish(request, timing, response)
+
+    @staticmethod
+    def finish(request, timing, response):
+        timing.total = time.perf_counter() - timing.started
+        route = route_name(request)
+        with LOCK:
+            ROUTES.setdefault(route, RouteStats()).observe(
+                timing, response.status_code
+            )
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timing.header()
+        if timing.total * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            logger.warning(
+                'Медленный ответ %.1f мс: %s %s (%s), %s',
+                timing.total * 1000, request.method, request.path, route,
+                timing.header(),
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing.render_started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: self.finish_render(timing)
+            )
+        return response
+
+    @staticmethod
+    def finish_render(timing):
+        timing.render = time.perf_counter() - timing.render_started
+
+
+def sample(name, labels, value):
+    labels = ','.join(f'{key}="{label}"' for key, label in labels.items())
+    return f'{name}{{{labels}}} {value}' if labels else f'{name} {value}'
+
+
+def render_metrics():
+    """Метрики процесса в текстовом формате Prometheus."""
+    lines = [
+        '# TYPE foodgram_request_duration_seconds histogram',
+    ]
+    with LOCK:
+        routes = {
+            route: (list(stats.buckets), dict(stats.requests),
+                    dict(stats.seconds), stats.queries)
+            for route, stats in ROUTES.items()
+        }
+    for route, (buckets, _, seconds, _) in sorted(routes.items()):
+        total = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), buckets):
+            total += count
+            lines.append(sample(
+                'foodgram_request_duration_seconds_bucket',
+                {'route': route, 'le': bound}, total,
+            ))
+        lines.append(sample(
+            'foodgram_request_duration_seconds_sum', {'route': route},
+            round(seconds['total'], 6),
+        ))
+        lines.append(sample(
+            'foodgram_request_duration_seconds_count', {'route': route},
+            total,
+        ))
+    lines.append('# TYPE foodgram_requests_total counter')
+    for route, (_, requests, _, _) in sorted(routes.items()):
+        for status_class, count in sorted(requests.items()):
+            lines.append(sample(
+                'foodgram_requests_total',
+                {'route': route, 'status': status_class}, count,
+            ))
+    lines.append('# TYPE foodgram_request_phase_seconds_total counter')
+    for route, (_, _, seconds, _) in sorted(routes.items()):
+        for phase in PHASES:
+            lines.append(sample(
+                'foodgram_request_phase_seconds_total',
+                {'route': route, 'phase': phase}, round(seconds[phase], 6),
+            ))
+    lines.append('# TYPE foodgram_db_queries_total counter')
+    for route, (_, _, _, queries) in sorted(routes.items()):
+        lines.append(sample(
+            'foodgram_db_queries_total', {'route': route}, queries
+        ))
+    stats = membership_stats()
+    lines.append('# TYPE foodgram_membership_cache_total counter')
+    for result in ('hits', 'misses'):
+        lines.append(sample(
+            'foodgram_membership_cache_total', {'result': result},
+            stats[result],
+        ))
+    lines.append('# TYPE foodgram_membership_size gauge')
+    for kind, sizes in sorted(stats['sizes'].items()):
+        for aggregate in ('max', 'mean'):
+            if sizes[aggregate] is not None:
+                lines.append(sample(
+                    'foodgram_membership_size',
+                    {'kind': kind, 'aggregate': aggregate}, sizes[aggregate],
+                ))
+    return '\n'.join(lines) + '\n'
@@ -1,7 +1,14 @@
+import hashlib
+
+from django.db.models import prefetch_related_objects
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from recipes.models import User
 from rest_framework import mixins, viewsets
+from rest_framework.response import Response
 
 from .serializers import UserSerializer
+from .snapshots import snapshot_response, snapshot_version
 
 
 class ModelViewSetMixins(viewsets.ModelViewSet):
@@ -13,3 +20,145 @@ class ListRetrieveViewSet(mixins.ListModelMixin,
                           mixins.RetrieveModelMixin,
                           viewsets.GenericViewSet):
     pass
+
+
+class CursorPaginationMixin:
+    """Включает cursor_pagination_class, если в запросе передан cursor."""
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.pagination_class
+            if (self.cursor_pagination_class is not None
+                    and 'cursor' in self.request.query_params):
+                pagination_class = self.cursor_pagination_class
+            self._paginator = (
+                None if pagination_class is None else pagination_class()
+            )
+        return self._paginator
+
+
+class SnapshotListMixin:
+    """Отдаёт список из кешированного снимка snapshot_name."""
+    snapshot_name = None
+
+    def list(self, request, *args, **kwargs):
+        return snapshot_response(request, self.snapshot_name)
+
+
+class ConditionalGetMixin:
+    """Добавляет ETag к list и retrieve, а к retrieve — Last-Modified.
+
+    Валидаторы считаются по полям validator_fields, поэтому ответ 304
+    обходится без сериализации. Список выбирается и разбивается на
+    страницы один раз, а prefetch_related выполняется, только если
+    ответ действительно нужно сериализовать. Данные, зависящие от
+    пользователя, учитываются через get_validator_salt. Last-Modified
+    отдаётся только анонимным пользователям и только для одного объекта:
+    дата последней записи страницы не меняется, когда запись удаляют или
+    она выпадает из фильтра.
+    """
+    validator_fields = ()
+    modified_field = None
+    snapshot_names = ()
+
+    def get_validator_salt(self):
+        return ''
+
+    def get_validator_row(self, instance):
+        row = []
+        for field in self.validator_fields:
+            value = instance
+            for name in field.split('__'):
+                value = getattr(value, name)
+            row.append(value)
+        return tuple(row)
+
+    def get_etag(self, rows):
+        digest = hashlib.sha1(self.request.get_full_path().encode())
+        digest.update(self.get_validator_salt().encode())
+        for name in self.snapshot_names:
+            digest.update(snapshot_version(name)['etag'].encode())
+        for row in rows:
+            digest.update(repr(row).encode())
+        return f'"{digest.hexdigest()}"'
+
+    def get_last_modified(self, rows):
+        """Последнее изменение объекта или снимков, от которых зависит
+        его представление."""
+        if not self.request.user.is_anonymous:
+            return None
+        index = self.validator_fields.index(self.modified_field)
+        return int(max(
+            [row[index].timestamp() for row in rows]
+            + [snapshot_version(name)['modified']
+               for name in self.snapshot_names]
+        ))
+
+    def get_page_state(self):
+        """Поля ответа со страницей, кроме results: общее число записей и
+        ссылки на соседние страницы. Удаление записи с другой страницы
+        меняет их, даже если сама страница осталась прежней."""
+        paginator = self.paginator
+        page = getattr(paginator, 'page', None)
+        return (
+            getattr(getattr(page, 'paginator', None), 'count', None),
+            paginator.get_next_link(),
+            getattr(paginator, 'get_previous_link', lambda: None)(),
+        )
+
+    def conditional_response(self, rows, respond, last_modified=None):
+        etag = self.get_etag(rows)
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = respond()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_validator_queryset(self):
+        return self.filter_queryset(self.get_queryset()).prefetch_related(
+            None
+        ).values_list(*self.validator_fields)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookups = queryset._prefetch_related_lookups
+        queryset = queryset.prefetch_related(None)
+        page = self.paginate_queryset(queryset)
+        objects = list(queryset) if page is None else page
+
+        def respond():
+            prefetch_related_objects(objects, *lookups)
+            serializer = self.get_serializer(objects, many=True)
+            if page is None:
+                return Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
+
+        rows = [self.get_validator_row(instance) for instance in objects]
+        if page is not None:
+            rows.append(self.get_page_state())
+        return self.conditional_response(rows, respond)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        try:
+            rows = list(self.get_validator_queryset().filter(
+                **{self.lookup_field: kwargs[lookup]}
+            ))
+        except (TypeError, ValueError):
+            rows = None
+        if not rows:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            rows,
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            ),
+            self.get_last_modified(rows),
+        )
@@ -1,5 +1,99 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по убыванию ключа keyset без COUNT и OFFSET.
+
+    Курсор хранит значения ключа последней выданной записи, поэтому
+    новые записи не сдвигают уже открытые страницы.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    keyset = ('pub_date', 'id')
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by(*(f'-{name}' for name in self.keyset))
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position_filter(self, position):
+        condition = Q()
+        for index, name in enumerate(self.keyset):
+            step = Q(**{f'{name}__lt': position[index]})
+            for previous in range(index):
+                step &= Q(**{self.keyset[previous]: position[previous]})
+            condition |= step
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.keyset):
+                raise ValueError
+            return [
+                self.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.keyset, values)
+            ]
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance):
+        values = [
+            self.model._meta.get_field(name).value_to_string(instance)
+            for name in self.keyset
+        ]
+        encoded = base64.urlsafe_b64encode(json.dumps(values).encode())
+        return encoded.decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class FollowKeysetPagination(KeysetPagination):
+    keyset = ('id',)
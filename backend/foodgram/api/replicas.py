@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+from .dbwrappers import execute_wrapper
+
+PIN_COOKIE = 'pin_primary'
+
+# Токен читается сразу после входа, поэтому отставание реплики здесь
+# превращается в 401; пользователь с токеном и так лежит в кеше.
+PRIMARY_APPS = {'authtoken'}
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+STATE = ContextVar('replica_state', default=None)
+
+
+class ReadState:
+    """Куда текущий запрос может отправлять чтения.
+
+    Как обёртка выполнения SQL основной базы замечает записи, включая
+    сырой SQL, и после первой из них оставляет чтения на основной базе.
+    """
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.alias = None
+        self.wrote = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:7].upper().startswith(WRITES):
+            self.replica = False
+            self.wrote = True
+        return execute(sql, params, many, context)
+
+
+def pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    digest = hashlib.sha1(authorization.encode()).hexdigest()
+    return f'replica:pin:{digest}'
+
+
+def is_pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    key = pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+class ReplicaRouter:
+    """Отправляет чтения безопасных запросов на одну из реплик.
+
+    Записи, чтения внутри транзакции и чтения после записи в том же
+    запросе идут в основную базу. db_for_write Django вызывает и без
+    записи, например при присваивании связанного объекта, поэтому
+    записи отслеживает ReadState. Вне запроса, например в командах
+    manage.py, реплики не используются.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = STATE.get()
+        if (state is None or not state.replica
+                or not settings.REPLICA_DATABASES
+                or model._meta.app_label in PRIMARY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            state.alias = random.choice(settings.REPLICA_DATABASES)
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """Разрешает чтение с реплик GET/HEAD/OPTIONS запросам и после
+    записи закрепляет клиента за основной базой на
+    REPLICA_PIN_SECONDS: по cookie и, для клиентов с токеном, по
+    заголовку Authorization."""
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        with self.read_state(request) as state:
+            response = self.get_response(request)
+        return self.finish(request, state, response)
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+        with self.read_state(request) as state:
+            response = await self.get_response(request)
+        return self.finish(request, state, response)
+
+    @staticmethod
+    @contextmanager
+    def read_state(request):
+        state = ReadState(
+            request.method in SAFE_METHODS and not is_pinned(request)
+        )
+        token = STATE.set(state)
+        try:
+            with execute_wrapper(state, using=DEFAULT_DB_ALIAS):
+                yield state
+        finally:
+            STATE.reset(token)
+
+    def finish(self, request, state, response):
+        if state.wrote or request.method not in SAFE_METHODS:
+            self.pin_client(request, response)
+        return response
+
+    @staticmethod
+    def pin_client(request, response):
+        seconds = settings.REPLICA_PIN_SECONDS
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax'
+        )
+        key = pin_key(request)
+        if key is not None:
+            cache.set(key, True, seconds)
@@ -1,14 +1,23 @@
 import base64
+import binascii
+import io
+import tempfile
+from collections import Counter
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
-                            Recipe, ShoppingList, Tag, User)
+from PIL import Image
+from recipes.images import thumbnail_url
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingList, Tag, User)
 from rest_framework import serializers
 from rest_framework.fields import ReadOnlyField
 from rest_framework.serializers import Field, SerializerMethodField
 
+from .membership import Membership
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta:
@@ -26,23 +35,67 @@ class CustomUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (request.user.is_authenticated
-                and Follow.objects.filter(
-                    user=request.user, author=obj
-                ).exists())
+        membership = Membership.for_request(self.context.get('request'))
+        return membership is not None and obj.id in membership.following
 
 
 class Base64ImageField(serializers.ImageField):
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_wide': 'Сторона изображения больше {max_dimension} пикселей.',
+        'invalid_base64': 'Некорректная строка base64.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
+            data = self.decode(data)
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        format, imgstr = data.split(';base64,')
+        ext = format.split('/')[-1]
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(imgstr) // 4 * 3 > max_size:
+            self.fail('too_large', max_size=max_size)
+        decoded = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for start in range(0, len(imgstr), self.chunk_size):
+                chunk = base64.b64decode(imgstr[start:start + self.chunk_size])
+                if not start:
+                    self.check_dimensions(chunk)
+                decoded.write(chunk)
+        except binascii.Error:
+            self.fail('invalid_base64')
+        decoded.seek(0)
+        return File(decoded, name='temp.' + ext)
+
+    def check_dimensions(self, head):
+        try:
+            with Image.open(io.BytesIO(head)) as image:
+                width, height = image.size
+        except (OSError, SyntaxError):
+            return
+        max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+        if max(width, height) > max_dimension:
+            self.fail('too_wide', max_dimension=max_dimension)
+
+
+class ThumbnailField(serializers.ImageField):
+    def __init__(self, size, **kwargs):
+        self.size = size
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = thumbnail_url(value, self.size)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -73,9 +126,7 @@ class IngredientsInRecipeSerializer(serializers.ModelSerializer):
 
 
 class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
 
     class Meta:
         model = IngredientInRecipe
@@ -85,10 +136,12 @@ class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(max_length=None, use_url=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = AddIngredientToRecipeSerializer(many=True)
+    ingredients = AddIngredientToRecipeSerializer(
+        many=True, allow_empty=False
+    )
     cooking_time = serializers.IntegerField()
-    tags = serializers.SlugRelatedField(
-        many=True, queryset=Tag.objects.all(), slug_field='id'
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
     )
 
     class Meta:
@@ -109,15 +162,84 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Введите число больше 0')
         return data
 
+    @staticmethod
+    def resolve_ids(model, ids, label):
+        """Загружает объекты одним in_bulk и собирает сообщения обо всех
+        несуществующих и повторяющихся id."""
+        found = model.objects.in_bulk(set(ids))
+        errors = [
+            f'{label} с id={pk} не существует'
+            for pk in sorted(set(ids) - found.keys())
+        ]
+        errors.extend(
+            f'{label} с id={pk} указан несколько раз'
+            for pk, count in sorted(Counter(ids).items()) if count > 1
+        )
+        return found, errors
+
+    def validate(self, data):
+        errors = {}
+        if 'ingredients' in data:
+            found, errors['ingredients'] = self.resolve_ids(
+                Ingredient,
+                [ingredient['id'] for ingredient in data['ingredients']],
+                'Ингредиент',
+            )
+            for ingredient in data['ingredients']:
+                ingredient['id'] = found.get(ingredient['id'])
+        if 'tags' in data:
+            found, errors['tags'] = self.resolve_ids(Tag, data['tags'], 'Тег')
+            data['tags'] = [found.get(pk) for pk in data['tags']]
+        errors = {field: value for field, value in errors.items() if value}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
+
     def create_ingredients(self, ingredients, recipe):
         IngredientInRecipe.objects.bulk_create(
             [IngredientInRecipe(
                 recipe=recipe,
-                ingredient=ingredient['id'],
+                ingredients=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def update_ingredients(self, ingredients, recipe):
+        """Меняет только отличающиеся строки IngredientInRecipe."""
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            row.ingredients_id: row
+            for row in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredients_id__in=removed
+            ).delete()
+        changed = []
+        for pk, row in current.items():
+            if pk in amounts and row.amount != amounts[pk]:
+                row.amount = amounts[pk]
+                changed.append(row)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(
+            [ingredient for ingredient in ingredients
+             if ingredient['id'].id not in current],
+            recipe,
+        )
+
+    def update_tags(self, tags, recipe):
+        current = set(recipe.tags.values_list('id', flat=True))
+        wanted = {tag.id for tag in tags}
+        if current - wanted:
+            recipe.tags.remove(*(current - wanted))
+        if wanted - current:
+            recipe.tags.add(*(wanted - current))
+
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
@@ -130,13 +252,18 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def update(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        IngredientInRecipe.objects.filter(recipe=recipe).delete()
-        self.create_ingredients(ingredients, recipe)
-        recipe.tags.set(tags)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if ingredients is not None:
+            self.update_ingredients(ingredients, recipe)
+        if tags is not None:
+            self.update_tags(tags, recipe)
         return super().update(recipe, validated_data)
 
+    def to_representation(self, instance):
+        instance = Recipe.objects.with_related().get(pk=instance.pk)
+        return RecipeReadSerializer(instance, context=self.context).data
+
 
 class RecipeForFollowersSerializer(serializers.ModelSerializer):
     class Meta:
@@ -159,6 +286,8 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     image = Base64ImageField()
+    image_small = ThumbnailField('small', source='image')
+    image_medium = ThumbnailField('medium', source='image')
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField('get_ingredients')
     is_favorited = serializers.SerializerMethodField('get_is_favorited')
@@ -177,29 +306,30 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_small',
+            'image_medium',
             'text',
             'cooking_time',
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        view = self.context.get('view')
+        if view is not None and view.action in ('list', 'feed'):
+            data['image'] = data['image_medium']
+        return data
+
     def get_ingredients(self, obj):
-        ingredients = IngredientInRecipe.objects.filter(recipe=obj)
+        ingredients = obj.recipeingredients.all()
         return IngredientsInRecipeSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        user = request.user
-        return Favorite.objects.filter(recipe=obj, user=user).exists()
+        membership = Membership.for_request(self.context.get('request'))
+        return membership is not None and obj.id in membership.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        user = request.user
-        return ShoppingList.objects.filter(
-            recipe=obj, user=user
-        ).exists()
+        membership = Membership.for_request(self.context.get('request'))
+        return membership is not None and obj.id in membership.cart
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -221,9 +351,19 @@ class ShoppingListSerializer(serializers.ModelSerializer):
         fields = ('user', 'recipe')
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
+
+
 class RecipeFollowUserField(Field):
 
     def get_attribute(self, instance):
+        if hasattr(instance.author, 'recipes_preview'):
+            return instance.author.recipes_preview
         return Recipe.objects.filter(author=instance.author)
 
     def to_representation(self, recipes_list):
@@ -233,7 +373,8 @@ class RecipeFollowUserField(Field):
                 {
                     'id': recipes.id,
                     'name': recipes.name,
-                    'image': recipes.image.url,
+                    'image': (thumbnail_url(recipes.image, 'small')
+                              if recipes.image else None),
                     'cooking_time': recipes.cooking_time,
                 }
             )
@@ -258,7 +399,7 @@ class FollowSerializer(serializers.ModelSerializer):
                   'recipes', 'recipes_count')
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(user=obj.user, author=obj.author).exists()
+        return True
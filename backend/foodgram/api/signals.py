@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import Ingredient, Tag, User
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens, invalidate_user
+from .dbwrappers import install
+from .snapshots import build_snapshot
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(**kwargs):
+    transaction.on_commit(lambda: build_snapshot('tags'))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(**kwargs):
+    transaction.on_commit(lambda: build_snapshot('ingredients'))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(instance, created, **kwargs):
+    if not created:
+        invalidate_user(instance)
+
+
+@receiver(connection_created)
+def connection_opened(connection, **kwargs):
+    install(connection)
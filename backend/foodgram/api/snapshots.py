@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from recipes.models import Ingredient, Tag
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import IngredientSerializer, TagSerializer
+
+SNAPSHOTS = {
+    'tags': (Tag, TagSerializer),
+    'ingredients': (Ingredient, IngredientSerializer),
+}
+
+
+PARSED = {}
+
+
+def snapshot_key(name):
+    return f'snapshot:{name}'
+
+
+def version_key(name):
+    return f'snapshot:{name}:version'
+
+
+def build_snapshot(name):
+    """Сериализует таблицу целиком, сжимает её и кладёт в кеш.
+
+    Снимок живёт SNAPSHOT_CACHE_TTL секунд, поэтому даже с локальным
+    кешем процесса изменения из других процессов видны не позже, чем
+    через этот срок. Версия и время изменения хранятся отдельно и
+    меняются, только если изменилось содержимое.
+    """
+    model, serializer_class = SNAPSHOTS[name]
+    body = JSONRenderer().render(
+        serializer_class(model.objects.all(), many=True).data
+    )
+    etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+    version = cache.get(version_key(name))
+    if version is None or version['etag'] != etag:
+        version = {
+            'version': version['version'] + 1 if version else 1,
+            'etag': etag,
+            'modified': int(time.time()),
+        }
+        cache.set(version_key(name), version, None)
+    snapshot = dict(version, body=body, gzip=gzip.compress(body, mtime=0))
+    cache.set(snapshot_key(name), snapshot, settings.SNAPSHOT_CACHE_TTL)
+    return snapshot
+
+
+def get_snapshot(name):
+    return cache.get(snapshot_key(name)) or build_snapshot(name)
+
+
+def snapshot_version(name):
+    """Версия, ETag и время изменения снимка без его тела.
+
+    Запись маленькая и живёт без срока, поэтому её можно читать на
+    каждый запрос; тело снимка собирается, только если версии ещё нет.
+    """
+    return cache.get(version_key(name)) or build_snapshot(name)
+
+
+def snapshot_rows(name):
+    """Строки снимка; JSON разбирается один раз на версию снимка."""
+    snapshot = get_snapshot(name)
+    etag, rows = PARSED.get(name, (None, None))
+    if etag != snapshot['etag']:
+        rows = json.loads(snapshot['body'])
+        PARSED[name] = (snapshot['etag'], rows)
+    return rows
+
+
+def snapshot_response(request, name):
+    snapshot = get_snapshot(name)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if snapshot['etag'] in if_none_match or if_none_match == '*':
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(snapshot['gzip'],
+                                content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(snapshot['body'],
+                                content_type='application/json')
+    response['ETag'] = snapshot['etag']
+    response['X-Snapshot-Version'] = snapshot['version']
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
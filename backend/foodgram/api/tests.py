@@ -0,0 +1,450 @@
+import asyncio
+import io
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import (AsyncClient, TestCase, TransactionTestCase,
+                         override_settings, skipUnlessDBFeature)
+from django.urls import include, path, resolve
+from PIL import Image
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingList, Tag,
+                            User)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .async_views import make_async
+from .membership import membership_key
+from .urls import router_v1
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Маршруты API с асинхронными представлениями чтения, как при
+# ASYNC_READ_VIEWS, для AsyncReadViewsTest.
+urlpatterns = [
+    path('api/', include((make_async(router_v1.urls), 'api'))),
+]
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 120, 40)).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), 'recipe.png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        tags = [
+            Tag.objects.create(name=f'tag{i}', slug=f'tag{i}',
+                               color=f'#00000{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'ingredient{i}',
+                                      measurement_unit='г')
+            for i in range(5)
+        ]
+        for i in range(12):
+            recipe = Recipe(author=cls.user, name=f'recipe{i}', text='text',
+                            cooking_time=5)
+            recipe.image.save('recipe.png', png(), save=False)
+            recipe.save()
+            recipe.tags.set(tags)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredients=ingredient,
+                                   amount=i + 1)
+                for ingredient in ingredients
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def assert_list_queries(self, count):
+        for limit in (1, 10):
+            cache.clear()
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(count):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries(6)
+
+    def test_authenticated(self):
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assert_list_queries(10)
+
+    def test_not_modified_skips_prefetch(self):
+        response = self.client.get('/api/recipes/', {'limit': 10})
+        self.assertNotIn('Last-Modified', response)
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/recipes/', {'limit': 10},
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_covers_other_pages(self):
+        response = self.client.get('/api/recipes/', {'limit': 1})
+        etag = response['ETag']
+        Recipe.objects.order_by('pub_date').first().delete()
+        response = self.client.get(
+            '/api/recipes/', {'limit': 1}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 11)
+
+    def test_detail_last_modified(self):
+        recipe = Recipe.objects.first()
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """Пользователь кешируется по токену без хеша пароля и только при
+    TOKEN_AUTH_CACHE_TTL."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        self.token = Token.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def test_process_cache_not_used(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertIsNone(cache.get(f'auth:token:{self.token.key}'))
+
+    @override_settings(TOKEN_AUTH_CACHE_TTL=60)
+    def test_password_not_cached(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        cached = cache.get(f'auth:token:{self.token.key}')
+        self.assertEqual(cached.get_deferred_fields(), {'password'})
+        self.assertTrue(cached.check_password('pass'))
+
+
+class FavoriteTest(TestCase):
+
+    def test_response_recipe_is_integer(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='recipe', text='text', cooking_time=5
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.json()['recipe'], recipe.id)
+
+
+class MembershipCacheTest(TestCase):
+    """Множества пользователя кешируются только при MEMBERSHIP_CACHE_TTL."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='recipe', text='text', cooking_time=5
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.key = membership_key(self.user.id, 'favorites')
+
+    def test_process_cache_not_used(self):
+        self.client.get('/api/recipes/')
+        self.assertIsNone(cache.get(self.key))
+
+    @override_settings(MEMBERSHIP_CACHE_TTL=600)
+    def test_invalidated_on_change(self):
+        self.client.get('/api/recipes/')
+        self.assertIsNotNone(cache.get(self.key))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertIsNone(cache.get(self.key))
+        response = self.client.get('/api/recipes/')
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeThumbnailTest(TestCase):
+    """Уменьшенные копии создаются, только когда меняется картинка."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+
+    def test_missing_image_does_not_fail_save(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=5,
+            image='recipes/missing.png',
+        )
+        self.assertEqual(recipe.image.name, 'recipes/missing.png')
+
+    def test_thumbnails_only_on_image_change(self):
+        recipe = Recipe(author=self.author, name='recipe', text='text',
+                        cooking_time=5)
+        recipe.image.save('recipe.png', png(), save=False)
+        with mock.patch('recipes.signals.make_thumbnails') as make:
+            recipe.save()
+            recipe = Recipe.objects.get(pk=recipe.pk)
+            recipe.name = 'renamed'
+            recipe.save()
+            self.assertEqual(make.call_count, 1)
+            recipe.image = 'recipes/other.png'
+            recipe.save()
+            self.assertEqual(make.call_count, 2)
+
+
+class CounterDeleteTest(TestCase):
+    """Каскадное удаление связей не обновляет счётчики построчно."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=5
+        )
+        self.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com',
+                password='pass',
+            )
+            for i in range(20)
+        ]
+        for user in self.users:
+            Favorite.objects.create(user=user, recipe=self.recipe)
+            Follow.objects.create(user=user, author=self.author)
+
+    def test_recipe_delete_does_not_scale_with_favorites(self):
+        with self.assertNumQueries(8):
+            self.recipe.delete()
+
+    def test_user_delete_releases_counters(self):
+        self.users[0].delete()
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 19)
+        self.assertEqual(self.author.followers_count, 19)
+
+
+@override_settings(FEED_MAX_LENGTH=2)
+class FeedTest(TestCase):
+    """Публикация не обрезает ленты, а лента отдаёт только
+    FEED_MAX_LENGTH последних записей."""
+
+    def test_feed_capped_on_read(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        Follow.objects.create(user=reader, author=author)
+        for i in range(3):
+            Recipe.objects.create(author=author, name=f'recipe{i}',
+                                  text='text', cooking_time=5)
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 3)
+        client = APIClient()
+        client.force_authenticate(reader)
+        response = client.get('/api/recipes/feed/')
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['recipe2', 'recipe1'],
+        )
+        self.assertIsNone(response.data['next'])
+
+
+class ShoppingCartExportTest(TestCase):
+    """Выгрузка списка покупок работает и под WSGI, и под ASGI."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        recipe = Recipe.objects.create(
+            author=cls.user, name='recipe', text='text', cooking_time=5
+        )
+        IngredientInRecipe.objects.create(
+            recipe=recipe, amount=3, ingredients=Ingredient.objects.create(
+                name='Свёкла', measurement_unit='г'
+            ),
+        )
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def assert_export(self, file_format, content):
+        if file_format == 'pdf':
+            self.assertTrue(content.startswith(b'%PDF-'))
+            self.assertIn(b'/FontFile2', content)
+            self.assertLess(len(content), 50 * 1024)
+        else:
+            self.assertIn('Свёкла', content.decode())
+
+    def test_wsgi(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        for file_format in ('txt', 'csv', 'pdf'):
+            with self.subTest(file_format=file_format):
+                response = client.get(
+                    '/api/recipes/download_shopping_cart/',
+                    {'file_format': file_format},
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.streaming)
+                self.assert_export(
+                    file_format, b''.join(response.streaming_content)
+                )
+
+    async def test_asgi(self):
+        client = AsyncClient()
+        for file_format in ('txt', 'csv', 'pdf'):
+            with self.subTest(file_format=file_format):
+                # AsyncClient в Django 3.2 не переносит data в строку
+                # запроса, поэтому параметры передаются в пути.
+                response = await client.get(
+                    '/api/recipes/download_shopping_cart/'
+                    f'?file_format={file_format}',
+                    authorization=f'Token {self.token.key}',
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.streaming)
+                self.assert_export(file_format, response.content)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class FavoriteRaceTest(TransactionTestCase):
+    """Параллельные добавления одного рецепта в избранное создают одну
+    связь и увеличивают счётчик один раз."""
+    threads = 8
+
+    def test_concurrent_favorite(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='recipe', text='text', cooking_time=5
+        )
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def favorite():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                response = client.post(f'/api/recipes/{recipe.id}/favorite/')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=favorite) for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(sorted(statuses), [201] + [400] * (self.threads - 1))
+        self.assertEqual(
+            Favorite.objects.filter(user=user, recipe=recipe).count(), 1
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+
+@override_settings(ROOT_URLCONF='api.tests', MEDIA_ROOT=MEDIA_ROOT)
+class AsyncReadViewsTest(TransactionTestCase):
+    """Чтение через асинхронные обёртки ASYNC_ROUTES под ASGI.
+
+    Обёртки выполняют представление в общем пуле потоков со своими
+    соединениями, которые не видят незафиксированную транзакцию
+    TestCase, поэтому здесь TransactionTestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        self.token = Token.objects.create(user=reader).key
+        self.recipes = [
+            Recipe.objects.create(author=author, name=f'recipe{i}',
+                                  text='text', cooking_time=5)
+            for i in range(2)
+        ]
+        Follow.objects.create(user=reader, author=author)
+
+    def get(self, path, **headers):
+        return AsyncClient().get(
+            path, authorization=f'Token {self.token}', **headers
+        )
+
+    def test_routes_are_async(self):
+        for route in ('/api/recipes/', f'/api/recipes/{self.recipes[0].id}/',
+                      '/api/users/subscriptions/'):
+            with self.subTest(route=route):
+                self.assertTrue(
+                    asyncio.iscoroutinefunction(resolve(route).func)
+                )
+
+    async def test_list(self):
+        response = await self.get('/api/recipes/?limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(response.json()['results'][0]['name'], 'recipe1')
+        response = await self.get(
+            '/api/recipes/?limit=1', if_none_match=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_detail(self):
+        recipe = self.recipes[0]
+        response = await self.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], recipe.id)
+
+    async def test_subscriptions(self):
+        response = await self.get(
+            '/api/users/subscriptions/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['username'], 'author')
+        self.assertEqual(len(results[0]['recipes']), 1)
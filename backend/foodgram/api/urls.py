@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import FollowViewSet, IngredientViewSet, RecipeViewSet, TagsViewSet
+from .async_views import make_async
+from .views import (FollowViewSet, IngredientViewSet, MetricsView,
+                    RecipeViewSet, TagsViewSet)
 
 app_name = 'api'
 
@@ -11,8 +14,13 @@ router_v1.register('ingredients', IngredientViewSet, 'ingredients')
 router_v1.register('recipes', RecipeViewSet, 'recipes')
 router_v1.register('users', FollowViewSet, 'users')
 
+router_urls = router_v1.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = make_async(router_urls)
+
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
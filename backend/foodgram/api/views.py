@@ -1,62 +1,90 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Prefetch, Sum
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
+from recipes import feed, relations
 from recipes.models import (Favorite, Follow, Ingredient, IngredientInRecipe,
                             Recipe, ShoppingList, Tag, User)
+from recipes.search import search_ingredients
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filters import IngredientsFilter, RecipeFilter
-from .mixins import ListRetrieveViewSet
-from .pagination import PageLimitPagination
+from .exports import EXPORTS
+from .filters import RecipeFilter
+from .membership import Membership, invalidate
+from .metrics import render_metrics
+from .mixins import (ConditionalGetMixin, CursorPaginationMixin,
+                     ListRetrieveViewSet, SnapshotListMixin)
+from .pagination import (FollowKeysetPagination, KeysetPagination,
+                         PageLimitPagination)
 from .permissions import AdminAuthorOrReadOnly
 from .serializers import (FavoriteSerializer, FollowSerializer,
                           IngredientSerializer, RecipeForFollowersSerializer,
-                          RecipeReadSerializer, RecipeSerializer,
-                          TagSerializer)
+                          RecipeIdsSerializer, RecipeReadSerializer,
+                          RecipeSerializer, TagSerializer)
+from .snapshots import snapshot_version
 
 
-class FollowViewSet(UserViewSet):
+class FollowViewSet(CursorPaginationMixin, UserViewSet):
+    lookup_value_regex = r'\d+'
     pagination_class = PageLimitPagination
+    cursor_pagination_class = FollowKeysetPagination
+
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return limit if limit >= 0 else None
+
+    def get_following(self):
+        return Follow.objects.filter(user=self.request.user).with_recipes(
+            self.get_recipes_limit()
+        )
 
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-
-        if user == author:
+        if int(id) == user.id:
             return Response({
                 'errors': 'Вы не можете подписываться на самого себя'
             }, status=status.HTTP_400_BAD_REQUEST)
-        if Follow.objects.filter(user=user, author=author).exists():
+        if not relations.add(Follow, user, author=id):
+            get_object_or_404(User, id=id)
             return Response({
                 'errors': 'Вы уже подписаны на данного пользователя'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        follow = Follow.objects.create(user=user, author=author)
+        invalidate(user, 'following')
+        feed.backfill(user, id)
         serializer = FollowSerializer(
-            follow, context={'request': request}
+            self.get_following().get(author_id=id),
+            context={'request': request}
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def del_subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        if user == author:
+        if int(id) == user.id:
             return Response({
                 'errors': 'Вы не можете отписываться от самого себя'
             }, status=status.HTTP_400_BAD_REQUEST)
-        follow = Follow.objects.filter(user=user, author=author)
-        if follow.exists():
-            follow.delete()
+        if relations.remove(Follow, user, author=id):
+            invalidate(user, 'following')
+            feed.unfollow(user, id)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+        get_object_or_404(User, id=id)
         return Response({
             'errors': 'Вы уже отписались'
         }, status=status.HTTP_400_BAD_REQUEST)
@@ -64,35 +92,62 @@ class FollowViewSet(UserViewSet):
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, serializer):
-        following = Follow.objects.filter(user=self.request.user)
+        following = self.get_following().order_by('-id')
         pages = self.paginate_queryset(following)
-        serializer = FollowSerializer(pages, many=True)
+        serializer = FollowSerializer(
+            pages, many=True, context={'request': self.request}
+        )
         return self.get_paginated_response(serializer.data)
 
 
-class TagsViewSet(ListRetrieveViewSet):
+class TagsViewSet(SnapshotListMixin, ListRetrieveViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    snapshot_name = 'tags'
 
 
-class IngredientViewSet(ListRetrieveViewSet):
+class IngredientViewSet(SnapshotListMixin, ListRetrieveViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientsFilter
     pagination_class = None
+    snapshot_name = 'ingredients'
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(search_ingredients(
+            name, snapshot_version('ingredients')['etag']
+        ), many=True)
+        return Response(serializer.data)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ConditionalGetMixin, CursorPaginationMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    lookup_value_regex = r'\d+'
     permission_classes = (AdminAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     serializer_class = RecipeSerializer
     pagination_class = PageLimitPagination
+    cursor_pagination_class = KeysetPagination
+    validator_fields = (
+        'id', 'updated_at', 'author__email', 'author__username',
+        'author__first_name', 'author__last_name',
+    )
+    modified_field = 'updated_at'
+    snapshot_names = ('tags', 'ingredients')
+
+    def get_queryset(self):
+        return Recipe.objects.with_related()
+
+    def get_validator_salt(self):
+        membership = Membership.for_request(self.request)
+        return '' if membership is None else membership.digest
 
     def get_serializer_class(self):
         method = self.request.method
@@ -107,64 +162,160 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def favorite(self, request, pk):
         user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
+            if not relations.add(Favorite, user, recipe=pk):
+                get_object_or_404(Recipe, id=pk)
                 return Response(
                     {'error': 'Этот рецепт уже в избранном'},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            favorite = Favorite.objects.create(user=user, recipe=recipe)
-            serializer = FavoriteSerializer(favorite,
-                                            context={'request': request})
+            invalidate(user, 'favorites')
+            serializer = FavoriteSerializer(
+                Favorite(user=user, recipe_id=int(pk)),
+                context={'request': request},
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if request.method == 'DELETE':
-            favorite = Favorite.objects.filter(user=user, recipe=recipe)
-            if favorite.exists():
-                favorite.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+        if relations.remove(Favorite, user, recipe=pk):
+            invalidate(user, 'favorites')
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, id=pk)
+        return Response(
+            {'error': 'Этого рецепта нет в избранном'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     @action(
         detail=True, methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
         if request.method == 'POST':
-            ShoppingList.objects.create(user=request.user,
-                                        recipe=recipe)
-            serializer = RecipeForFollowersSerializer(recipe)
+            if not relations.add(ShoppingList, request.user, recipe=pk):
+                get_object_or_404(Recipe, pk=pk)
+                return Response(
+                    {'error': 'Этот рецепт уже в списке покупок'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            invalidate(request.user, 'cart')
+            serializer = RecipeForFollowersSerializer(
+                Recipe.objects.get(pk=pk)
+            )
             return Response(data=serializer.data,
                             status=status.HTTP_201_CREATED)
-        deleted = get_object_or_404(ShoppingList,
-                                    user=request.user,
-                                    recipe=recipe)
-        deleted.delete()
+        if not relations.remove(ShoppingList, request.user, recipe=pk):
+            get_object_or_404(Recipe, pk=pk)
+            return Response(
+                {'error': 'Этого рецепта нет в списке покупок'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        invalidate(request.user, 'cart')
         return Response({'message': 'Рецепт успешно удален из списка покупок'},
                         status=status.HTTP_200_OK)
 
+    def apply_batch(self, request, model, kind):
+        """Добавляет или удаляет пачку рецептов одним запросом к базе и
+        возвращает результат для каждого id."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        if request.method == 'POST':
+            changed = relations.add_many(model, request.user, recipe=ids)
+            outcomes = ('added', 'exists')
+        else:
+            changed = relations.remove_many(model, request.user, recipe=ids)
+            outcomes = ('removed', 'absent')
+        if changed:
+            invalidate(request.user, kind)
+        unchanged = set(ids) - changed
+        found = set(Recipe.objects.filter(id__in=unchanged).order_by(
+        ).values_list('id', flat=True)) if unchanged else set()
+        return Response({'results': [
+            {'id': pk, 'status': outcomes[0] if pk in changed
+             else outcomes[1] if pk in found else 'not_found'}
+            for pk in ids
+        ]})
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite', url_name='favorite-batch',
+            permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def favorite_batch(self, request):
+        return self.apply_batch(request, Favorite, 'favorites')
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart', url_name='shopping-cart-batch',
+            permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def shopping_cart_batch(self, request):
+        return self.apply_batch(request, ShoppingList, 'cart')
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        entries = feed.entries(request.user.id).select_related(
+            'recipe__author'
+        ).prefetch_related(
+            'recipe__tags',
+            Prefetch(
+                'recipe__recipeingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredients'
+                ),
+            ),
+        )
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(entries, request, view=self)
+        serializer = RecipeReadSerializer(
+            [entry.recipe for entry in page], many=True,
+            context=self.get_serializer_context(),
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated, ]
     )
     def download_shopping_cart(self, request):
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in EXPORTS:
+            return Response({
+                'errors': 'Доступные форматы: ' + ', '.join(EXPORTS)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        export, content_type = EXPORTS[file_format]
         ingredients = IngredientInRecipe.objects.filter(
             recipe__lists__user=request.user
         ).values(
             'ingredients__name', 'ingredients__measurement_unit'
-        ).annotate(ingredients_amount=Sum('amount'))
-        shopping_list = ['Список покупок:\n']
-        for ingredient in ingredients:
-            name = ingredient['ingredients__name']
-            unit = ingredient['ingredients__measurement_unit']
-            amount = ingredient['ingredients_amount']
-            shopping_list.append(f'\n{name} - {amount}, {unit}')
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = ('attachment;'
-                                           'filename="shopping_cart.txt"')
+        ).annotate(
+            ingredients_amount=Sum('amount')
+        ).order_by('ingredients__name').iterator(chunk_size=500)
+        # ASGIHandler Django 3.2 перебирает потоковый ответ в цикле
+        # событий, где ORM недоступен, поэтому под ASGI файл собирается
+        # целиком здесь, в потоке представления.
+        response_class = (
+            HttpResponse if isinstance(request._request, ASGIRequest)
+            else StreamingHttpResponse
+        )
+        response = response_class(
+            export(ingredients), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"'
+        )
         return response
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            render_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.ServerTimingMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,6 +81,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Асинхронные представления для чтения (api.async_views), только под ASGI.
+# По умолчанию выключены: пока ORM синхронный, обёртка лишь переносит
+# запрос в пул потоков, и в bench_servers ASGI не быстрее WSGI (список
+# рецептов p50 794 против 711 мс). Оставлены для сравнения в bench_servers
+# и до перехода на асинхронные запросы к базе.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', default='False') == 'True'
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
@@ -112,6 +121,55 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: те же параметры, что у default, но с
+# другими DB_NAME и/или DB_HOST, через запятую. Для локальной проверки
+# хватит копии файла SQLite или второй базы PostgreSQL.
+REPLICA_NAMES = [
+    name for name in os.getenv('DB_REPLICA_NAMES', default='').split(',')
+    if name
+]
+REPLICA_HOSTS = [
+    host for host in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+    if host
+]
+REPLICA_DATABASES = []
+for index in range(max(len(REPLICA_NAMES), len(REPLICA_HOSTS))):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=(REPLICA_NAMES[index] if index < len(REPLICA_NAMES)
+              else DATABASES['default']['NAME']),
+        HOST=(REPLICA_HOSTS[index] if index < len(REPLICA_HOSTS)
+              else DATABASES['default']['HOST']),
+        TEST={'MIRROR': 'default'},
+    )
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает только из основной базы.
+REPLICA_PIN_SECONDS = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default='foodgram'
+        ),
+    }
+}
+
+# Общий ли кеш для всех процессов: записи LocMemCache сбрасываются только
+# в том процессе, где изменились данные.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
 AUTH_USER_MODEL = 'recipes.User'
 
 # Password validation
@@ -161,7 +219,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS':
@@ -187,3 +245,41 @@ DJOSER = {
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 EMPTY_VALUE = '-пусто-'
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 6000
+RECIPE_IMAGE_SIZES = {
+    'small': (240, 240),
+    'medium': (600, 600),
+}
+
+# Множества избранного, корзины и подписок (api.membership). По умолчанию
+# кешируются только в общем кеше: иначе другие процессы отдавали бы
+# устаревшие is_favorited и is_in_shopping_cart до конца TTL.
+MEMBERSHIP_CACHE_TTL = int(os.getenv(
+    'MEMBERSHIP_CACHE_TTL', default=600 if SHARED_CACHE else 0
+))
+
+SNAPSHOT_CACHE_TTL = 60
+
+# Пользователь по ключу токена (api.authentication). Как и множества выше,
+# по умолчанию кешируется только в общем кеше: иначе токен после выхода
+# принимали бы другие процессы до конца TTL.
+TOKEN_AUTH_CACHE_TTL = int(os.getenv(
+    'TOKEN_AUTH_CACHE_TTL', default=60 if SHARED_CACHE else 0
+))
+TOKEN_AUTH_LOCAL_CACHE_SIZE = 0
+TOKEN_AUTH_LOCAL_TTL = 5
+
+FEED_MAX_LENGTH = 1000
+
+RECIPE_BATCH_MAX_SIZE = 100
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+# Шрифт с кириллицей, который встраивается в PDF списка покупок.
+PDF_FONT_PATH = os.path.join(BASE_DIR, 'api', 'fonts', 'DejaVuSans.ttf')
+
+SERVER_TIMING_HEADER = True
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_REQUEST_THRESHOLD_MS = 1000
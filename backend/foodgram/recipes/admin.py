@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from .counters import change_counts, change_favorites_count
 from .models import Favorite, Ingredient, Recipe, ShoppingList, Tag
 
 
@@ -16,11 +17,10 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'count_favorites')
+    list_display = ('name', 'author', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
-
-    def count_favorites(self, obj):
-        return obj.favorites.count()
+    list_select_related = ('author',)
+    readonly_fields = ('favorites_count',)
 
 
 @admin.register(ShoppingList)
@@ -33,3 +33,12 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe',)
     list_filter = ('user',)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        change_favorites_count([obj.recipe_id], -1)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        change_counts(change_favorites_count, recipe_ids, -1)
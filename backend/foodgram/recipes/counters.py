@@ -0,0 +1,54 @@
+from collections import Counter, defaultdict
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Favorite, Follow, Recipe, User
+
+
+def shifted(field, delta):
+    """Сдвигает счётчик на delta; уменьшение не опускает его ниже нуля,
+    даже если счётчик уже разошёлся с данными."""
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def change_favorites_count(recipe_ids, delta):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        favorites_count=shifted('favorites_count', delta)
+    )
+
+
+def change_recipes_count(author_ids, delta):
+    User.objects.filter(pk__in=author_ids).update(
+        recipes_count=shifted('recipes_count', delta)
+    )
+
+
+def change_followers_count(author_ids, delta):
+    User.objects.filter(pk__in=author_ids).update(
+        followers_count=shifted('followers_count', delta)
+    )
+
+
+def change_counts(change, ids, sign=1):
+    """Сдвигает счётчик каждого id на sign, умноженный на число его
+    повторов в ids, одним UPDATE на каждую величину сдвига."""
+    grouped = defaultdict(list)
+    for pk, total in Counter(ids).items():
+        grouped[total].append(pk)
+    for total, pks in grouped.items():
+        change(pks, sign * total)
+
+
+def release_user(user):
+    """Уменьшает счётчики, которые держат избранное и подписки
+    удаляемого пользователя: по одному UPDATE на каждый счётчик вместо
+    обработчика на каждую удаляемую строку."""
+    change_favorites_count(
+        Favorite.objects.filter(user=user).values('recipe_id'), -1
+    )
+    change_followers_count(
+        Follow.objects.filter(user=user).values('author_id'), -1
+    )
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import FeedEntry, Follow, Recipe
+
+
+def publish(recipe):
+    """Раскладывает новый рецепт по лентам всех подписчиков автора.
+
+    Ленты здесь не обрезаются: иначе стоимость публикации росла бы с
+    числом подписчиков. Читается только FEED_MAX_LENGTH последних
+    записей (см. entries), а лишние удаляет команда trim_feeds.
+    """
+    followers = Follow.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True).iterator()
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+         for user_id in followers),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user, author):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    recipes = Recipe.objects.filter(author=author).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_MAX_LENGTH]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user=user, recipe_id=pk, pub_date=pub_date)
+         for pk, pub_date in recipes],
+        ignore_conflicts=True,
+    )
+    trim(user.id)
+
+
+def unfollow(user, author):
+    FeedEntry.objects.filter(user=user, recipe__author=author).delete()
+
+
+def boundary(user_id):
+    """Ключ (pub_date, id) первой записи за пределами FEED_MAX_LENGTH
+    последних или None, если лента не переполнена."""
+    return FeedEntry.objects.filter(user_id=user_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('pub_date', 'id')[settings.FEED_MAX_LENGTH:][:1].first()
+
+
+def entries(user_id):
+    """Записи ленты в пределах FEED_MAX_LENGTH последних."""
+    feed = FeedEntry.objects.filter(user_id=user_id)
+    last = boundary(user_id)
+    if last is None:
+        return feed
+    pub_date, pk = last
+    return feed.filter(
+        Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+    )
+
+
+def trim(user_id):
+    """Удаляет из ленты записи старше FEED_MAX_LENGTH последних."""
+    last = boundary(user_id)
+    if last is not None:
+        pub_date, pk = last
+        FeedEntry.objects.filter(
+            user_id=user_id, pub_date__lte=pub_date
+        ).exclude(pub_date=pub_date, id__gt=pk).delete()
+
+
+def trim_all():
+    overflowing = list(FeedEntry.objects.values('user_id').annotate(
+        total=Count('id')
+    ).filter(total__gt=settings.FEED_MAX_LENGTH).values_list(
+        'user_id', flat=True
+    ))
+    for user_id in overflowing:
+        trim(user_id)
+    return len(overflowing)
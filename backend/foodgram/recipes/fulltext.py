@@ -0,0 +1,86 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+WORD = re.compile(r'\w+')
+
+POSTGRESQL_SCHEMA = (
+    "ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector "
+    "tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector "
+    "ON recipes_recipe USING gin (search_vector)",
+)
+
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5("
+    "name, text, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert "
+    "AFTER INSERT ON recipes_recipe BEGIN "
+    "INSERT INTO recipes_recipe_fts(rowid, name, text) "
+    "VALUES (new.id, new.name, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete "
+    "AFTER DELETE ON recipes_recipe BEGIN "
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text) "
+    "VALUES ('delete', old.id, old.name, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update "
+    "AFTER UPDATE OF name, text ON recipes_recipe BEGIN "
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text) "
+    "VALUES ('delete', old.id, old.name, old.text); "
+    "INSERT INTO recipes_recipe_fts(rowid, name, text) "
+    "VALUES (new.id, new.name, new.text); END",
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')",
+)
+
+
+def install(using_connection):
+    """Создаёт полнотекстовый индекс рецептов, если его ещё нет.
+
+    На PostgreSQL это вычисляемый столбец tsvector с GIN-индексом, на
+    SQLite — внешняя таблица FTS5 с триггерами синхронизации.
+    """
+    schema = {
+        'postgresql': POSTGRESQL_SCHEMA,
+        'sqlite': SQLITE_SCHEMA,
+    }.get(using_connection.vendor, ())
+    with using_connection.cursor() as cursor:
+        for statement in schema:
+            cursor.execute(statement)
+
+
+def sqlite_match(query):
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+
+def search(queryset, query):
+    """Оставляет рецепты, найденные по названию и описанию, и добавляет
+    релевантность search_rank: чем больше, тем выше в выдаче."""
+    if connection.vendor == 'postgresql':
+        return queryset.annotate(
+            search_match=RawSQL(
+                "recipes_recipe.search_vector @@ "
+                "plainto_tsquery('russian', %s)",
+                (query,), output_field=BooleanField(),
+            ),
+            search_rank=RawSQL(
+                "ts_rank(recipes_recipe.search_vector, "
+                "plainto_tsquery('russian', %s))",
+                (query,), output_field=FloatField(),
+            ),
+        ).filter(search_match=True).order_by('-search_rank', '-pub_date')
+    if connection.vendor == 'sqlite':
+        match = sqlite_match(query)
+        if not match:
+            return queryset.none()
+        return queryset.extra(
+            select={'search_rank': '-bm25(recipes_recipe_fts, 10.0, 1.0)'},
+            tables=['recipes_recipe_fts'],
+            where=['recipes_recipe_fts MATCH %s',
+                   'recipes_recipe_fts.rowid = recipes_recipe.id'],
+            params=[match],
+        ).order_by('-search_rank', '-pub_date')
+    return queryset.filter(name__icontains=query)
@@ -0,0 +1,78 @@
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+
+class HashedName(str):
+    """Имя файла, уже выведенное из содержимого."""
+
+
+@deconstructible
+class HashedFileSystemStorage(FileSystemStorage):
+    """Хранит файлы под именем sha256 содержимого.
+
+    Повторная загрузка той же картинки не создаёт новый файл, а
+    возвращает имя уже сохранённого.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # FileSystemStorage._save запрашивает новое имя, когда файл
+        # успели создать параллельно. Под хешированным именем лежит то же
+        # содержимое, поэтому сохранение на этом заканчивается.
+        if isinstance(name, HashedName):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = HashedName(
+            os.path.join(directory, digest.hexdigest() + extension)
+        )
+        if self.exists(name):
+            return str(name)
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            return str(name)
+
+
+def thumbnail_name(name, size):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbs', f'{stem}_{size}.jpg')
+
+
+def thumbnail_url(image, size):
+    return default_storage.url(thumbnail_name(image.name, size))
+
+
+def make_thumbnails(image):
+    """Создаёт недостающие уменьшенные копии из RECIPE_IMAGE_SIZES."""
+    missing = {
+        size: name for size, name in (
+            (size, thumbnail_name(image.name, size))
+            for size in settings.RECIPE_IMAGE_SIZES
+        ) if not default_storage.exists(name)
+    }
+    if not missing:
+        return
+    with image.open('rb') as f, Image.open(f) as source:
+        source = source.convert('RGB')
+        for size, name in missing.items():
+            thumbnail = source.copy()
+            thumbnail.thumbnail(settings.RECIPE_IMAGE_SIZES[size])
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, 'JPEG', quality=85, optimize=True)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
@@ -0,0 +1,306 @@
+import base64
+import io
+import itertools
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import Client
+from PIL import Image
+from recipes.models import Ingredient, Recipe, Tag, User
+from recipes.search import normalize
+from rest_framework.authtoken.models import Token
+
+RECIPE_FILTERS = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+
+
+def percentiles(timings):
+    if len(timings) < 2:
+        return timings[0], timings[0]
+    cuts = statistics.quantiles(timings, n=20)
+    return statistics.median(timings), cuts[18]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def png_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку p50/p95, пропускную способность и число '
+            'запросов к базе для основных эндпоинтов API на текущей базе '
+            'и сравнивает результат с сохранённым эталоном.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя; по умолчанию владелец самой большой '
+                 'корзины',
+        )
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--only', nargs='*', default=(),
+            help='Префиксы имён сценариев',
+        )
+        parser.add_argument('--output', help='Куда сохранить JSON')
+        parser.add_argument('--baseline', help='JSON прошлого запуска')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно эталона',
+        )
+
+    def handle(self, **options):
+        self.options = options
+        self.setup()
+        results = {}
+        for name, request, writes in self.scenarios():
+            if options['only'] and not name.startswith(tuple(
+                options['only']
+            )):
+                continue
+            results[name] = self.measure(request, writes)
+            self.report(name, results[name])
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'user': self.user.username,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'seed': options['seed'],
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def setup(self):
+        self.rng = random.Random(self.options['seed'])
+        self.user = self.get_user(self.options['user'])
+        self.token = Token.objects.get_or_create(user=self.user)[0].key
+        self.local = threading.local()
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден')
+        user = User.objects.annotate(cart=Count('lists')).order_by(
+            '-cart', 'id'
+        ).first()
+        if user is None:
+            raise CommandError(
+                'База пуста: сначала выполните generate_data'
+            )
+        return user
+
+    @property
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client(
+                HTTP_AUTHORIZATION=f'Token {self.token}'
+            )
+        return self.local.client
+
+    def scenarios(self):
+        """Возвращает тройки (имя, запрос, пишет ли запрос в базу)."""
+        rng = self.rng
+        recipe_ids = list(Recipe.objects.order_by(
+            '-favorites_count'
+        ).values_list('id', flat=True)[:100])
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        authors = list(User.objects.order_by(
+            '-followers_count'
+        ).values_list('id', flat=True)[:20])
+        names = list(Ingredient.objects.values_list(
+            'name', flat=True
+        )[:1000])
+        values = {
+            'tags': lambda: rng.sample(tag_slugs, min(2, len(tag_slugs))),
+            'author': lambda: rng.choice(authors),
+            'is_favorited': lambda: 1,
+            'is_in_shopping_cart': lambda: 1,
+        }
+
+        def get(path, params=lambda: {}):
+            return lambda: self.client.get(path, params())
+
+        for size in range(len(RECIPE_FILTERS) + 1):
+            for combination in itertools.combinations(RECIPE_FILTERS, size):
+                name = '+'.join(combination) or 'all'
+                yield f'recipes-list[{name}]', get(
+                    '/api/recipes/',
+                    lambda combination=combination: {
+                        field: values[field]() for field in combination
+                    },
+                ), False
+        yield 'recipes-list[cursor]', get(
+            '/api/recipes/', lambda: {'cursor': ''}
+        ), False
+        yield 'recipes-list[search]', get(
+            '/api/recipes/',
+            lambda: {'search': rng.choice(names).split()[0]},
+        ), False
+        yield 'recipes-detail', lambda: self.client.get(
+            f'/api/recipes/{rng.choice(recipe_ids)}/'
+        ), False
+        yield 'recipes-feed', get('/api/recipes/feed/'), False
+        yield 'users-subscriptions', get(
+            '/api/users/subscriptions/', lambda: {'recipes_limit': 3}
+        ), False
+        yield 'ingredients-search', get(
+            '/api/ingredients/',
+            lambda: {'name': normalize(rng.choice(names))[:rng.randint(1, 4)]},
+        ), False
+        for file_format in ('txt', 'pdf'):
+            yield f'recipes-download-shopping-cart[{file_format}]', get(
+                '/api/recipes/download_shopping_cart/',
+                lambda file_format=file_format: {'file_format': file_format},
+            ), False
+        ingredient_ids = list(Ingredient.objects.values_list(
+            'id', flat=True
+        )[:1000])
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        image = png_base64()
+        target = []
+
+        def payload():
+            return {
+                'name': 'Тестовый рецепт',
+                'text': 'Описание тестового рецепта',
+                'cooking_time': rng.randint(5, 120),
+                'image': image,
+                'tags': rng.sample(tag_ids, min(2, len(tag_ids))),
+                'ingredients': [
+                    {'id': pk, 'amount': rng.randint(1, 500)}
+                    for pk in rng.sample(
+                        ingredient_ids, min(5, len(ingredient_ids))
+                    )
+                ],
+            }
+
+        def create():
+            return self.client.post(
+                '/api/recipes/', payload(), content_type='application/json'
+            )
+
+        def update():
+            if not target:
+                target.append(create().json()['id'])
+            data = payload()
+            del data['image']
+            return self.client.patch(
+                f'/api/recipes/{target[0]}/', data,
+                content_type='application/json',
+            )
+
+        yield 'recipes-create', create, True
+        yield 'recipes-update', update, True
+
+    def measure(self, request, writes):
+        """Первый запрос прогревает кеши, второй считает запросы к базе,
+        остальные замеряются; записи откатываются после замера."""
+        with transaction.atomic():
+            self.call(request)
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                response = self.call(request)
+            total = self.options['requests']
+            concurrency = 1 if writes else self.options['concurrency']
+            started = time.perf_counter()
+            if concurrency == 1:
+                timings = self.run(request, total)
+            else:
+                with ThreadPoolExecutor(concurrency) as executor:
+                    timings = list(itertools.chain.from_iterable(
+                        executor.map(
+                            lambda count: self.run(request, count, True),
+                            [len(part) for part in (
+                                range(total)[index::concurrency]
+                                for index in range(concurrency)
+                            )],
+                        )
+                    ))
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(writes)
+        p50, p95 = percentiles(timings)
+        return {
+            'status': response.status_code,
+            'queries': queries.count,
+            'p50_ms': round(p50, 3),
+            'p95_ms': round(p95, 3),
+            'rps': round(len(timings) / elapsed, 1),
+        }
+
+    @staticmethod
+    def call(request):
+        response = request()
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def run(self, request, count, worker=False):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            self.call(request)
+            timings.append((time.perf_counter() - started) * 1000)
+        if worker:
+            connections.close_all()
+        return timings
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name}: {result["status"]}, запросов {result["queries"]}, '
+            f'p50 {result["p50_ms"]:.2f} мс, p95 {result["p95_ms"]:.2f} мс, '
+            f'{result["rps"]} rps'
+        )
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                regressions.append(
+                    f'{name}: запросов {expected["queries"]} -> '
+                    f'{result["queries"]}'
+                )
+            if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {expected["p95_ms"]} -> '
+                    f'{result["p95_ms"]} мс'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно эталона:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
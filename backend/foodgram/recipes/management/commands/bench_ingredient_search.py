@@ -0,0 +1,70 @@
+import json
+import os
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.search import IngredientIndex, normalize
+
+DEFAULT_FILE = os.path.join(
+    settings.BASE_DIR, '..', '..', 'data', 'ingredients.json'
+)
+
+
+class Command(BaseCommand):
+    help = ('Замеряет префиксный поиск ингредиентов на данных из '
+            'ingredients.json и на синтетическом наборе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=DEFAULT_FILE)
+        parser.add_argument('--synthetic', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, **options):
+        rng = random.Random(options['seed'])
+        with open(options['file'], encoding='utf-8') as f:
+            names = [row['name'] for row in json.load(f)]
+        self.bench('ingredients.json', names, rng, options['queries'])
+        if options['synthetic']:
+            words = sorted({word for name in names for word in name.split()})
+            synthetic = [
+                ' '.join(rng.choices(words, k=rng.randint(1, 3)))
+                for _ in range(options['synthetic'])
+            ]
+            self.bench('synthetic', synthetic, rng, options['queries'])
+
+    def bench(self, label, names, rng, count):
+        started = time.perf_counter()
+        index = IngredientIndex(enumerate(names, start=1))
+        build = time.perf_counter() - started
+        queries = [
+            normalize(name)[:rng.randint(1, 4)]
+            for name in rng.choices(names, k=count)
+        ]
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        indexed = self.measure(lambda q: index.search(q, limit), queries)
+        keys = [normalize(name) for name in names]
+        scanned = self.measure(
+            lambda q: [key for key in keys if q in key][:limit],
+            queries[:max(1, count // 10)],
+        )
+        self.stdout.write(
+            f'{label}: {len(names)} строк, индекс построен за {build:.2f} с\n'
+            f'  индекс: p50 {indexed[0]:.3f} мс, p95 {indexed[1]:.3f} мс\n'
+            f'  icontains-скан: p50 {scanned[0]:.3f} мс, '
+            f'p95 {scanned[1]:.3f} мс'
+        )
+
+    def measure(self, search, queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        if len(timings) < 2:
+            return timings[0], timings[0]
+        cuts = statistics.quantiles(timings, n=20)
+        return statistics.median(timings), cuts[18]
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from recipes.models import Ingredient, Recipe, User
+from recipes.search import normalize
+
+from .bench_api import Command as BenchCommand
+from .bench_api import percentiles
+
+SERVERS = {
+    'wsgi': (
+        'gunicorn.app.wsgiapp', 'foodgram.wsgi:application',
+        '--worker-class', 'gthread', '--workers', '1', '--threads',
+        '{threads}', '--bind', '{host}:{port}',
+    ),
+    'asgi': (
+        'uvicorn', 'foodgram.asgi:application', '--workers', '1', '--host',
+        '{host}', '--port', '{port}', '--log-level', 'warning',
+        '--no-access-log',
+    ),
+}
+
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class Command(BenchCommand):
+    help = ('Запускает проект под gunicorn (WSGI, gthread) и uvicorn (ASGI) '
+            'с одним рабочим процессом и сравнивает задержку и пропускную '
+            'способность эндпоинтов чтения под конкурентной нагрузкой.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--only', nargs='*', default=(),
+            help='Префиксы имён сценариев',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Число одновременных клиентов',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Потоков у рабочего процесса gunicorn',
+        )
+        parser.add_argument(
+            '--slow-ms', type=int, default=0,
+            help='Пауза клиента посреди заголовков запроса',
+        )
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--output', help='Куда сохранить JSON')
+
+    def handle(self, **options):
+        self.options = options
+        self.setup()
+        scenarios = [
+            (name, path) for name, path in self.read_scenarios()
+            if not options['only'] or name.startswith(tuple(options['only']))
+        ]
+        results = {name: {} for name, _ in scenarios}
+        for kind in SERVERS:
+            port = free_port(options['host'])
+            process = self.start(kind, port)
+            try:
+                for name, path in scenarios:
+                    results[name][kind] = asyncio.run(self.load(port, path))
+            finally:
+                process.terminate()
+                process.wait(10)
+        for name, result in results.items():
+            for kind, stats in result.items():
+                self.report(f'{name} [{kind}]', stats)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'meta': {
+                        key: options[key] for key in (
+                            'requests', 'concurrency', 'threads', 'slow_ms',
+                            'seed',
+                        )
+                    },
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+
+    def read_scenarios(self):
+        """Пары (имя, функция, возвращающая путь запроса)."""
+        rng = self.rng
+        recipe_ids = list(Recipe.objects.order_by(
+            '-favorites_count'
+        ).values_list('id', flat=True)[:100])
+        authors = list(User.objects.order_by(
+            '-followers_count'
+        ).values_list('id', flat=True)[:20])
+        names = list(Ingredient.objects.values_list(
+            'name', flat=True
+        )[:1000])
+        yield 'recipes-list', lambda: '/api/recipes/'
+        yield 'recipes-list[author]', lambda: (
+            f'/api/recipes/?author={rng.choice(authors)}'
+        )
+        yield 'recipes-list[is_favorited]', lambda: (
+            '/api/recipes/?is_favorited=1'
+        )
+        yield 'recipes-detail', lambda: (
+            f'/api/recipes/{rng.choice(recipe_ids)}/'
+        )
+        yield 'tags-list', lambda: '/api/tags/'
+        yield 'ingredients-search', lambda: '/api/ingredients/?name={}'.format(
+            quote(normalize(rng.choice(names))[:rng.randint(1, 4)])
+        )
+        yield 'users-subscriptions', lambda: (
+            '/api/users/subscriptions/?recipes_limit=3'
+        )
+        for file_format in ('txt', 'pdf'):
+            yield f'recipes-download-shopping-cart[{file_format}]', (
+                lambda file_format=file_format: (
+                    '/api/recipes/download_shopping_cart/'
+                    f'?file_format={file_format}'
+                )
+            )
+
+    def start(self, kind, port):
+        command = [sys.executable, '-m'] + [
+            part.format(port=port, **self.options) for part in SERVERS[kind]
+        ]
+        process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR,
+            env=dict(os.environ, ASYNC_READ_VIEWS=str(kind == 'asgi')),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(
+                    f'{kind}: сервер завершился с кодом {process.returncode}'
+                )
+            try:
+                status, _ = asyncio.run(self.fetch(port, '/api/tags/', 0))
+            except OSError:
+                time.sleep(0.2)
+                continue
+            if status == 200:
+                return process
+        process.terminate()
+        raise CommandError(f'{kind}: сервер не ответил за 30 секунд')
+
+    async def fetch(self, port, path, slow):
+        """Один запрос в отдельном соединении; медленный клиент делает
+        паузу посреди заголовков и держит соединение занятым."""
+        host = self.options['host']
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'.encode())
+            if slow:
+                await writer.drain()
+                await asyncio.sleep(slow)
+            writer.write((
+                f'Authorization: Token {self.token}\r\n'
+                'Connection: close\r\n\r\n'
+            ).encode())
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        status = int(response.split(b' ', 2)[1]) if response else 0
+        return status, (time.perf_counter() - started) * 1000
+
+    async def load(self, port, path):
+        slow = self.options['slow_ms'] / 1000
+        pending = iter(range(self.options['requests']))
+        timings = []
+        errors = []
+        statuses = set()
+
+        async def client():
+            for _ in pending:
+                try:
+                    status, timing = await self.fetch(port, path(), slow)
+                except OSError as error:
+                    errors.append(str(error))
+                    continue
+                statuses.add(status)
+                timings.append(timing)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client() for _ in range(self.options['concurrency'])
+        ))
+        elapsed = time.perf_counter() - started
+        if not timings:
+            raise CommandError(f'Все запросы завершились ошибкой: {errors[0]}')
+        p50, p95 = percentiles(timings)
+        return {
+            'status': ','.join(str(status) for status in sorted(statuses)),
+            'errors': len(errors),
+            'p50_ms': round(p50, 3),
+            'p95_ms': round(p95, 3),
+            'rps': round(len(timings) / elapsed, 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name}: {result["status"]}, ошибок {result["errors"]}, '
+            f'p50 {result["p50_ms"]:.2f} мс, p95 {result["p95_ms"]:.2f} мс, '
+            f'{result["rps"]} rps'
+        )
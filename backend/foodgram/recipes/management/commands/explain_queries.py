@@ -0,0 +1,191 @@
+import json
+import re
+
+from django.apps import apps
+from django.db import connection, transaction
+
+from .bench_api import Command as BenchCommand
+
+CLAUSE_END = re.compile(r' (?:GROUP BY|ORDER BY|LIMIT|HAVING) ')
+MAIN_TABLE = re.compile(r' FROM "(\w+)"')
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from walk(child)
+
+
+class Command(BenchCommand):
+    help = ('Выполняет EXPLAIN для SQL, который порождают эндпоинты API, '
+            'отмечает полные просмотры и сортировки больших таблиц и '
+            'предлагает индексы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--only', nargs='*', default=(),
+            help='Префиксы имён сценариев',
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='С какого числа строк таблица считается большой',
+        )
+        parser.add_argument('--output', help='Куда сохранить планы в JSON')
+
+    def handle(self, **options):
+        self.options = dict(options, requests=0, concurrency=1)
+        self.setup()
+        self.row_counts = {}
+        self.models = {
+            model._meta.db_table: model for model in apps.get_models(
+                include_auto_created=True
+            )
+        }
+        report = []
+        suggestions = {}
+        for name, request, writes in self.scenarios():
+            if options['only'] and not name.startswith(tuple(
+                options['only']
+            )):
+                continue
+            for sql, params in self.capture(request):
+                plan, issues = self.explain(sql, params)
+                report.append({
+                    'endpoint': name, 'sql': sql, 'plan': plan,
+                    'issues': issues,
+                })
+                if not issues:
+                    continue
+                self.stdout.write(self.style.WARNING(f'{name}:'))
+                self.stdout.write(f'  {sql[:300]}')
+                for table, issue in issues:
+                    self.stdout.write(f'  - {table}: {issue}')
+                    suggestion = self.suggest(table, sql)
+                    if suggestion:
+                        suggestions.setdefault(suggestion, set()).add(name)
+        self.stdout.write('\nПредлагаемые индексы:')
+        for (model, fields), endpoints in sorted(suggestions.items()):
+            self.stdout.write(
+                f'  {model}: models.Index(fields={list(fields)!r}) '
+                f'# {", ".join(sorted(endpoints))}'
+            )
+        if not suggestions:
+            self.stdout.write('  нет')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2,
+                          default=str)
+
+    def capture(self, request):
+        """Выполняет запрос в откатываемой транзакции и возвращает
+        уникальные SELECT, которые он отправил в базу."""
+        queries = {}
+
+        def wrapper(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith('SELECT'):
+                queries.setdefault(sql, params)
+            return execute(sql, params, many, context)
+
+        with transaction.atomic():
+            with connection.execute_wrapper(wrapper):
+                self.call(request)
+            transaction.set_rollback(True)
+        return queries.items()
+
+    def rows(self, table):
+        if table not in self.row_counts:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+                )
+                self.row_counts[table] = cursor.fetchone()[0]
+        return self.row_counts[table]
+
+    def is_large(self, table):
+        return (table in self.models
+                and self.rows(table) >= self.options['min_rows'])
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0][0]['Plan']
+                return plan, self.postgresql_issues(plan, sql)
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        return plan, self.sqlite_issues(plan, sql)
+
+    def postgresql_issues(self, plan, sql):
+        issues = []
+        main = MAIN_TABLE.search(sql)
+        for node in walk(plan):
+            table = node.get('Relation Name')
+            if node['Node Type'] == 'Seq Scan' and self.is_large(table):
+                issues.append((table, 'последовательный просмотр'))
+            if (node['Node Type'] in ('Sort', 'Incremental Sort')
+                    and main and self.is_large(main.group(1))):
+                issues.append((main.group(1), 'сортировка: {}'.format(
+                    ', '.join(node.get('Sort Key', ()))
+                )))
+        return issues
+
+    def sqlite_issues(self, plan, sql):
+        issues = []
+        main = MAIN_TABLE.search(sql)
+        for detail in plan:
+            scan = re.match(r'SCAN (\w+)', detail)
+            if (scan and ' USING ' not in detail
+                    and self.is_large(scan.group(1))):
+                issues.append((scan.group(1), 'последовательный просмотр'))
+            if ('TEMP B-TREE FOR ORDER BY' in detail and main
+                    and self.is_large(main.group(1))):
+                issues.append((main.group(1), 'сортировка во временном '
+                                              'B-дереве'))
+        return issues
+
+    def suggest(self, table, sql):
+        """Составной индекс из столбцов table, которые сравниваются на
+        равенство в WHERE, и столбцов ORDER BY; None, если подходящий
+        индекс уже есть."""
+        model = self.models[table]
+        columns = {field.column: field.name
+                   for field in model._meta.concrete_fields}
+        where = sql.split(' WHERE ', 1)[1] if ' WHERE ' in sql else ''
+        where = CLAUSE_END.split(where)[0]
+        column = rf'"{table}"\."(\w+)"'
+        fields = []
+        for name in re.findall(rf'{column} (?:= %s|IN \()', where):
+            if (name in columns and name != model._meta.pk.column
+                    and columns[name] not in fields):
+                fields.append(columns[name])
+        order = sql.rsplit(' ORDER BY ', 1)
+        if len(order) == 2 and not order[1].count(')') > order[1].count('('):
+            for name, direction in re.findall(
+                rf'{column} (ASC|DESC)', order[1]
+            ):
+                if name in columns and columns[name] not in fields:
+                    prefix = '-' if direction == 'DESC' else ''
+                    fields.append(prefix + columns[name])
+        if not fields or self.covered(model, fields):
+            return None
+        return f'{model._meta.app_label}.{model.__name__}', tuple(fields)
+
+    @staticmethod
+    def covered(model, fields):
+        wanted = [field.lstrip('-') for field in fields]
+        existing = [list(index.fields) for index in model._meta.indexes]
+        existing += [
+            list(constraint.fields)
+            for constraint in model._meta.constraints
+            if getattr(constraint, 'fields', None)
+        ]
+        existing += [
+            [field.name] for field in model._meta.concrete_fields
+            if field.db_index or field.unique
+        ]
+        return any(
+            [field.lstrip('-') for field in index[:len(wanted)]] == wanted
+            for index in existing
+        )
@@ -0,0 +1,281 @@
+import heapq
+import itertools
+import random
+from datetime import timedelta
+
+from api.snapshots import build_snapshot
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingList, Tag,
+                            User)
+
+from .import_data import Command as ImportCommand
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#D2B48C', 'dessert'),
+    ('Выпечка', '#B22222', 'baking'),
+)
+DISHES = ('Салат', 'Суп', 'Пирог', 'Рагу', 'Запеканка', 'Омлет', 'Паста',
+          'Каша', 'Соус', 'Котлеты')
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'password',
+               'is_superuser', 'is_staff', 'is_active', 'date_joined',
+               'recipes_count', 'followers_count')
+RECIPE_FIELDS = ('author', 'name', 'image', 'text', 'pub_date',
+                 'updated_at', 'cooking_time', 'favorites_count')
+
+
+def power_law(size, skew, rng):
+    """Накопленные веса 1 / rank ** skew для случайной перестановки
+    range(size): несколько элементов получают большую часть выборок."""
+    ranks = list(range(1, size + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(rank ** -skew for rank in ranks))
+
+
+def pick(rng, population, cum_weights, count, exclude=None):
+    """Выбирает до count разных элементов с весами cum_weights."""
+    count = min(count, len(population) - (exclude is not None))
+    chosen = set()
+    for _ in range(10):
+        if len(chosen) >= count:
+            break
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=2 * (count - len(chosen))
+        ))
+        chosen.discard(exclude)
+    return list(itertools.islice(chosen, count))
+
+
+def chunked(rows, size):
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(ImportCommand):
+    help = ('Создаёт воспроизводимый синтетический набор данных для '
+            'нагрузочного тестирования: пользователей, подписки, рецепты, '
+            'избранное и списки покупок со скошенными распределениями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=30,
+            help='Среднее число избранных рецептов пользователя',
+        )
+        parser.add_argument(
+            '--cart', type=float, default=5,
+            help='Среднее число рецептов в списке покупок',
+        )
+        parser.add_argument('--max-cart', type=int, default=300)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона популярности',
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument('--password', default='synthetic')
+        parser.add_argument('--no-feeds', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.adapt = connection.ops.adapt_datetimefield_value
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже существуют'
+            )
+        self.ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', 'name')
+        )
+        if not self.ingredients:
+            raise CommandError(
+                'Нет ингредиентов: сначала выполните import_data'
+            )
+        with transaction.atomic():
+            tags = self.create_tags()
+            users = self.create_users()
+            follows = self.create_follows(users)
+            recipes = self.create_recipes(users, tags)
+            self.create_choices(users, recipes)
+            if not options['no_feeds']:
+                self.create_feeds(follows, recipes)
+            call_command('recount_counters', stdout=self.stdout)
+            transaction.on_commit(lambda: build_snapshot('tags'))
+
+    def insert(self, model, fields, rows):
+        created = 0
+        for batch in chunked(rows, self.options['batch_size']):
+            created += self.flush(model, fields, batch)
+        self.stdout.write(
+            f'  {model._meta.model_name}: добавлено {created}'
+        )
+        return created
+
+    def create_tags(self):
+        existing = set(itertools.chain.from_iterable(
+            Tag.objects.values_list('color', 'slug')
+        ))
+        self.insert(Tag, ('name', 'color', 'slug'), (
+            tag for tag in TAGS
+            if tag[1] not in existing and tag[2] not in existing
+        ))
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password(self.options['password'])
+        now = self.adapt(self.now)
+        self.insert(User, USER_FIELDS, (
+            (f'{prefix}{number}', f'{prefix}{number}@example.com',
+             f'Имя{number}', f'Фамилия{number}', password,
+             False, False, True, now, 0, 0)
+            for number in range(self.options['users'])
+        ))
+        ids = dict(User.objects.filter(
+            username__startswith=prefix
+        ).values_list('username', 'id'))
+        return [
+            ids[f'{prefix}{number}']
+            for number in range(self.options['users'])
+        ]
+
+    def create_follows(self, users):
+        """Подписки на авторов по степенному закону; возвращает словарь
+        user_id -> список id авторов."""
+        rng = self.rng
+        self.popularity = power_law(len(users), self.options['skew'], rng)
+        follows = {}
+        mean = self.options['follows']
+        for user in users:
+            count = round(rng.expovariate(1 / mean)) if mean else 0
+            follows[user] = pick(
+                rng, users, self.popularity, count, exclude=user
+            )
+        self.insert(Follow, ('user', 'author'), (
+            (user, author)
+            for user, authors in follows.items() for author in authors
+        ))
+        return follows
+
+    def create_recipes(self, users, tags):
+        """Создаёт рецепты в порядке публикации и возвращает список пар
+        (id, pub_date)."""
+        rng = self.rng
+        total = self.options['recipes']
+        authors = rng.choices(users, cum_weights=self.popularity, k=total)
+        span = timedelta(days=self.options['days']).total_seconds()
+        dates = [
+            self.now - timedelta(seconds=offset) for offset in
+            sorted((rng.uniform(0, span) for _ in range(total)),
+                   reverse=True)
+        ]
+        ingredient_ids = [pk for pk, _ in self.ingredients]
+        names = dict(self.ingredients)
+        ingredient_weights = power_law(len(ingredient_ids), 1.0, rng)
+        compositions = []
+        for _ in range(total):
+            compositions.append(pick(
+                rng, ingredient_ids, ingredient_weights, rng.randint(3, 10)
+            ))
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        self.insert(Recipe, RECIPE_FIELDS, (
+            (authors[index],
+             f'{rng.choice(DISHES)}: {names[composition[0]]}'[:200],
+             '',
+             'Понадобится: {}.'.format(
+                 ', '.join(names[pk] for pk in composition)
+             ),
+             self.adapt(dates[index]), self.adapt(dates[index]),
+             rng.randint(5, 180), 0)
+            for index, composition in enumerate(compositions)
+        ))
+        ids = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id'
+        ).values_list('id', flat=True))
+        if len(ids) != total:
+            raise CommandError('Не удалось сопоставить id рецептов')
+        self.insert(Recipe.tags.through, ('recipe', 'tag'), (
+            (pk, tag) for pk in ids
+            for tag in rng.sample(tags, min(len(tags), rng.randint(1, 3)))
+        ))
+        self.insert(
+            IngredientInRecipe, ('recipe', 'ingredients', 'amount'),
+            ((pk, ingredient, rng.randint(1, 500))
+             for pk, composition in zip(ids, compositions)
+             for ingredient in composition),
+        )
+        self.recipes_by_author = {}
+        for index, author in enumerate(authors):
+            self.recipes_by_author.setdefault(author, []).append(index)
+        return list(zip(ids, dates))
+
+    def create_choices(self, users, recipes):
+        """Избранное по степенному закону популярности рецептов и
+        списки покупок с тяжёлым хвостом размеров."""
+        rng = self.rng
+        options = self.options
+        ids = [pk for pk, _ in recipes]
+        if not ids:
+            return
+        weights = power_law(len(ids), options['skew'], rng)
+        mean = options['favorites']
+        self.insert(Favorite, ('user', 'recipe'), (
+            (user, recipe) for user in users
+            for recipe in pick(
+                rng, ids, weights,
+                round(rng.expovariate(1 / mean)) if mean else 0,
+            )
+        ))
+        alpha = 1.2
+        scale = options['cart'] * (alpha - 1) / alpha
+        now = self.adapt(self.now)
+        self.insert(ShoppingList, ('user', 'recipe', 'date_add'), (
+            (user, recipe, now) for user in users
+            for recipe in pick(
+                rng, ids, weights,
+                min(options['max_cart'],
+                    int(rng.paretovariate(alpha) * scale)),
+            )
+        ))
+
+    def create_feeds(self, follows, recipes):
+        """Заполняет ленты последними FEED_MAX_LENGTH рецептами авторов,
+        на которых подписан пользователь, как это сделал бы publish()."""
+        limit = settings.FEED_MAX_LENGTH
+        by_author = self.recipes_by_author
+        dates = [(pk, self.adapt(pub_date)) for pk, pub_date in recipes]
+
+        def entries():
+            for user, authors in follows.items():
+                newest = heapq.merge(
+                    *(reversed(by_author.get(author, ()))
+                      for author in authors),
+                    reverse=True,
+                )
+                for index in itertools.islice(newest, limit):
+                    yield (user, *dates[index])
+
+        self.insert(FeedEntry, ('user', 'recipe', 'pub_date'), entries())
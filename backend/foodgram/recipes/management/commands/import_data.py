@@ -1,13 +1,189 @@
-from django.core.management.base import BaseCommand
-from recipes import models
+import csv
+import io
+import json
+import os
+
+from api.snapshots import build_snapshot
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.counters import change_counts, change_recipes_count
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag, User
+
+FIELDS = {
+    'ingredients': ('name', 'measurement_unit'),
+    'tags': ('name', 'color', 'slug'),
+}
+
+
+def read_rows(path, fields):
+    """Читает словари из JSON или CSV; у CSV без заголовка колонки
+    сопоставляются с fields по порядку."""
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        if tuple(column.strip() for column in header) != fields:
+            yield dict(zip(fields, header))
+        for row in reader:
+            if row:
+                yield dict(zip(fields, row))
 
 
 class Command(BaseCommand):
-    def handle(self, **options):
-        with open("ingredients.csv") as f:
-            for line in f:
-                ing = line.split(',')
-                models.Ingredient.objects.get_or_create(
-                    name=ing[0],
-                    measurement_unit=ing[1]
+    help = ('Загружает ингредиенты, теги и рецепты из CSV или JSON '
+            'пакетами в одной транзакции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['ingredients.csv'])
+        parser.add_argument(
+            '--model', default='ingredients',
+            choices=('ingredients', 'tags', 'recipes'),
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, paths, model, batch_size, **options):
+        load = getattr(self, f'load_{model}')
+        with transaction.atomic():
+            for path in paths:
+                if not os.path.exists(path):
+                    raise CommandError(f'Файл {path} не найден')
+                created = load(path, batch_size)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{path}: добавлено записей: {created}'
+                ))
+            if model in FIELDS:
+                transaction.on_commit(lambda: build_snapshot(model))
+
+    def progress(self, created, read):
+        self.stdout.write(f'  прочитано {read}, добавлено {created}')
+
+    def flush(self, model, fields, rows):
+        """Вставляет кортежи значений fields в обход создания моделей:
+        через COPY на PostgreSQL и пакетный INSERT с пропуском
+        конфликтов на остальных СУБД."""
+        if not rows:
+            return 0
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ', '.join(
+            quote(model._meta.get_field(field).column) for field in fields
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                    buffer,
                 )
+            else:
+                cursor.executemany(
+                    '{} {} ({}) VALUES ({}){}'.format(
+                        connection.ops.insert_statement(ignore_conflicts=True),
+                        table, columns, ', '.join(['%s'] * len(fields)),
+                        connection.ops.ignore_conflicts_suffix_sql(
+                            ignore_conflicts=True
+                        ),
+                    ),
+                    rows,
+                )
+        return len(rows)
+
+    def load_ingredients(self, path, batch_size):
+        seen = set(Ingredient.objects.values_list('name', 'measurement_unit'))
+        created = read = 0
+        batch = []
+        for row in read_rows(path, FIELDS['ingredients']):
+            read += 1
+            key = (row['name'].strip(), row['measurement_unit'].strip())
+            if key in seen:
+                continue
+            seen.add(key)
+            batch.append(key)
+            if len(batch) == batch_size:
+                created += self.flush(
+                    Ingredient, FIELDS['ingredients'], batch
+                )
+                batch = []
+                self.progress(created, read)
+        return created + self.flush(Ingredient, FIELDS['ingredients'], batch)
+
+    def load_tags(self, path, batch_size):
+        seen = set(Tag.objects.values_list('slug', flat=True))
+        tags = []
+        for row in read_rows(path, FIELDS['tags']):
+            slug = row['slug'].strip()
+            if slug in seen:
+                continue
+            seen.add(slug)
+            tags.append((row['name'].strip(), row['color'].strip(), slug))
+        return self.flush(Tag, FIELDS['tags'], tags)
+
+    def load_recipes(self, path, batch_size):
+        """Загружает рецепты из JSON вида
+        {"author": "<username>", "name": ..., "text": ...,
+        "cooking_time": ..., "image": ..., "tags": ["<slug>"],
+        "ingredients": [{"name": ..., "measurement_unit": ...,
+        "amount": ...}]}."""
+        if not path.lower().endswith('.json'):
+            raise CommandError('Рецепты загружаются только из JSON')
+        authors = dict(User.objects.values_list('username', 'id'))
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        created = read = 0
+        batch = []
+        for row in read_rows(path, ()):
+            read += 1
+            try:
+                author = authors[row['author']]
+                row_tags = [tags[slug] for slug in row.get('tags', ())]
+                amounts = {
+                    ingredients[(item['name'], item['measurement_unit'])]:
+                    item['amount'] for item in row.get('ingredients', ())
+                }
+            except KeyError as error:
+                raise CommandError(
+                    f'Рецепт №{read}: не найдено {error}'
+                )
+            recipe = Recipe(
+                author_id=author, name=row['name'], text=row['text'],
+                cooking_time=row['cooking_time'], image=row.get('image', ''),
+            )
+            batch.append((recipe, row_tags, amounts))
+            if len(batch) == batch_size:
+                created += self.flush_recipes(batch, batch_size)
+                batch = []
+                self.progress(created, read)
+        return created + self.flush_recipes(batch, batch_size)
+
+    def flush_recipes(self, batch, batch_size):
+        recipes = [recipe for recipe, _, _ in batch]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes, batch_size=batch_size)
+            # bulk_create не отправляет post_save, поэтому recipes_count
+            # авторов увеличивается здесь.
+            change_counts(
+                change_recipes_count, [recipe.author_id for recipe in recipes]
+            )
+        else:
+            for recipe in recipes:
+                recipe.save()
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag)
+            for recipe, row_tags, _ in batch for tag in row_tags
+        ], batch_size=batch_size, ignore_conflicts=True)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe_id=recipe.id, ingredients_id=pk,
+                               amount=amount)
+            for recipe, _, amounts in batch for pk, amount in amounts.items()
+        ], batch_size=batch_size, ignore_conflicts=True)
+        return len(batch)
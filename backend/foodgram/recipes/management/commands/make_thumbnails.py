@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from recipes.images import make_thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создаёт недостающие уменьшенные копии картинок рецептов, '
+            'сохранённых до появления RECIPE_IMAGE_SIZES.')
+
+    def handle(self, **options):
+        seen = set()
+        lost = 0
+        recipes = Recipe.objects.exclude(image='').only('image').order_by()
+        for recipe in recipes.iterator():
+            if recipe.image.name in seen:
+                continue
+            seen.add(recipe.image.name)
+            try:
+                make_thumbnails(recipe.image)
+            except FileNotFoundError:
+                lost += 1
+                self.stderr.write(f'Нет файла {recipe.image.name}')
+        self.stdout.write(f'Картинок проверено: {len(seen)}, '
+                          f'без исходного файла: {lost}')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Follow, Recipe, User
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', lambda: count_of(Favorite, 'recipe')),
+    (User, 'recipes_count', lambda: count_of(Recipe, 'author')),
+    (User, 'followers_count', lambda: count_of(Follow, 'author')),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, рецептов и подписчиков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения',
+        )
+
+    @transaction.atomic
+    def handle(self, dry_run, **options):
+        for model, field, actual in COUNTERS:
+            drifted = model.objects.annotate(actual=actual()).exclude(
+                **{field: F('actual')}
+            )
+            total = drifted.count()
+            if total and not dry_run:
+                model.objects.filter(
+                    pk__in=drifted.values('pk')
+                ).update(**{field: actual()})
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: расхождений {total}'
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from recipes.feed import trim_all
+
+
+class Command(BaseCommand):
+    help = ('Обрезает ленты подписок до FEED_MAX_LENGTH записей. '
+            'Публикация рецепта ленты не обрезает, поэтому команду '
+            'стоит запускать по расписанию.')
+
+    def handle(self, **options):
+        self.stdout.write(f'Обрезано лент: {trim_all()}')
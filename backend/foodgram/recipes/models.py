@@ -2,9 +2,30 @@ from colorfield.fields import ColorField
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import OuterRef, Subquery
 
+from .images import HashedFileSystemStorage
 
-class User(AbstractUser):
+
+class CounterFieldsMixin:
+    """Исключает счётчики counter_fields из полного save().
+
+    Счётчики меняются только F()-обновлениями, поэтому сохранение
+    загруженного ранее объекта не должно затирать их старыми значениями.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     username = models.CharField(
         verbose_name='Имя пользователя',
         max_length=150,
@@ -38,6 +59,18 @@ class User(AbstractUser):
         blank=False,
         null=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ['id']
@@ -46,6 +79,17 @@ class User(AbstractUser):
         return self.username
 
 
+class FollowQuerySet(models.QuerySet):
+
+    def with_recipes(self, recipes_limit=None):
+        """Добавляет последние рецепты автора."""
+        return self.select_related('author').prefetch_related(models.Prefetch(
+            'author__recipes',
+            queryset=Recipe.objects.newest_per_author(recipes_limit),
+            to_attr='recipes_preview',
+        ))
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -56,6 +100,8 @@ class Follow(models.Model):
         related_name='following'
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         constraints = [models.UniqueConstraint(
             fields=['user',
@@ -107,12 +153,44 @@ class Ingredient(models.Model):
 
     class Meta:
         verbose_name = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            ),
+        )
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def newest_per_author(self, limit=None):
+        """Оставляет не больше limit последних рецептов каждого автора."""
+        queryset = self.only('id', 'name', 'image', 'cooking_time',
+                             'author_id', 'pub_date')
+        if limit is None:
+            return queryset
+        newest = Recipe.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-pub_date', '-id').values('id')[:limit]
+        return queryset.filter(id__in=Subquery(newest))
+
+    def with_related(self):
+        """Загружает автора, теги и ингредиенты фиксированным числом
+        запросов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipeingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredients'),
+            ),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -127,6 +205,7 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='recipes/',
+        storage=HashedFileSystemStorage(),
         blank=True,
     )
     text = models.TextField(
@@ -138,6 +217,10 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения рецепта',
+        auto_now=True,
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         verbose_name='Ингредиенты',
@@ -155,15 +238,41 @@ class Recipe(models.Model):
             1,
             'Минимальное время для приготовления 1 минута')],
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count',)
+    saved_image = None
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [models.Index(
+            fields=['author', '-pub_date'],
+            name='recipe_author_pub_date')]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        recipe = super().from_db(db, field_names, values)
+        recipe.saved_image = recipe.__dict__.get('image')
+        return recipe
+
+    def image_changed(self):
+        """Сменилась ли картинка с загрузки из базы или с прошлой
+        проверки."""
+        name = self.image.name
+        changed = name != self.saved_image
+        self.saved_image = name
+        return changed
+
 
 class IngredientInRecipe(models.Model):
     recipe = models.ForeignKey(
@@ -217,6 +326,9 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = verbose_name
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'],
+            name='unique_favorite')]
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в избранное'
@@ -253,3 +365,31 @@ class ShoppingList(models.Model):
     def __str__(self):
         return (f'{self.user} добавил'
                 f'{self.recipe} в список покупок')
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'],
+            name='unique_feed_entry')]
+        indexes = [models.Index(
+            fields=['user', '-pub_date', '-id'],
+            name='feed_user_pub_date')]
@@ -0,0 +1,123 @@
+from django.db import connection
+from django.utils import timezone
+
+from .counters import change_favorites_count, change_followers_count
+from .models import Favorite, Follow
+
+COUNTERS = {
+    Favorite: change_favorites_count,
+    Follow: change_followers_count,
+}
+
+
+def can_return_rows():
+    if connection.vendor == 'postgresql':
+        return True
+    return (connection.vendor == 'sqlite'
+            and connection.Database.sqlite_version_info >= (3, 35))
+
+
+def change_counter(model, ids, delta):
+    if ids and model in COUNTERS:
+        COUNTERS[model](ids, delta)
+
+
+def insert_sql(model, user, name, count):
+    """INSERT ... SELECT связей пользователя с count объектами, который
+    пропускает повторы и несуществующие id."""
+    field = model._meta.get_field(name)
+    quote = connection.ops.quote_name
+    related = field.related_model._meta
+    columns = [model._meta.get_field('user').column, field.column]
+    values = ['%s', quote(related.pk.column)]
+    params = [user.pk]
+    for extra in model._meta.concrete_fields:
+        if getattr(extra, 'auto_now_add', False):
+            columns.append(extra.column)
+            values.append('%s')
+            params.append(extra.get_db_prep_value(timezone.now(), connection))
+    sql = '{} {} ({}) SELECT {} FROM {} WHERE {} IN ({}){}'.format(
+        connection.ops.insert_statement(ignore_conflicts=True),
+        quote(model._meta.db_table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(values),
+        quote(related.db_table),
+        quote(related.pk.column),
+        ', '.join(['%s'] * count),
+        connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+    )
+    return sql, params
+
+
+def delete_sql(model, name, count):
+    quote = connection.ops.quote_name
+    return 'DELETE FROM {} WHERE {} = %s AND {} IN ({})'.format(
+        quote(model._meta.db_table),
+        quote(model._meta.get_field('user').column),
+        quote(model._meta.get_field(name).column),
+        ', '.join(['%s'] * count),
+    )
+
+
+def add(model, user, **target):
+    """Связывает пользователя с объектом одним INSERT ... SELECT.
+
+    Повтор и несуществующий объект не вызывают ошибку: в обоих случаях
+    возвращается False, и строка не добавляется.
+    """
+    (name, pk), = target.items()
+    sql, params = insert_sql(model, user, name, 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [pk])
+        added = cursor.rowcount
+    change_counter(model, [pk], added)
+    return added > 0
+
+
+def remove(model, user, **target):
+    """Удаляет связь одним DELETE; возвращает False, если её не было."""
+    (name, pk), = target.items()
+    with connection.cursor() as cursor:
+        cursor.execute(delete_sql(model, name, 1), [user.pk, pk])
+        removed = cursor.rowcount
+    change_counter(model, [pk], -removed)
+    return removed > 0
+
+
+def add_many(model, user, **targets):
+    """Связывает пользователя со списком объектов одним INSERT и
+    возвращает множество id, для которых строка действительно
+    добавлена."""
+    (name, ids), = targets.items()
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return set()
+    if not can_return_rows():
+        return {pk for pk in ids if add(model, user, **{name: pk})}
+    sql, params = insert_sql(model, user, name, len(ids))
+    column = connection.ops.quote_name(model._meta.get_field(name).column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {column}', params + ids)
+        added = {row[0] for row in cursor.fetchall()}
+    change_counter(model, added, 1)
+    return added
+
+
+def remove_many(model, user, **targets):
+    """Удаляет связи со списком объектов одним DELETE и возвращает
+    множество id, для которых связь была."""
+    (name, ids), = targets.items()
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return set()
+    if not can_return_rows():
+        return {pk for pk in ids if remove(model, user, **{name: pk})}
+    column = connection.ops.quote_name(model._meta.get_field(name).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{delete_sql(model, name, len(ids))} RETURNING {column}',
+            [user.pk] + ids,
+        )
+        removed = [row[0] for row in cursor.fetchall()]
+    change_counter(model, removed, -1)
+    return set(removed)
@@ -0,0 +1,108 @@
+import re
+from array import array
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from .models import Ingredient
+
+WORD_START = re.compile(r'\b\w')
+
+_index = None
+_lock = Lock()
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е').strip()
+
+
+class IngredientIndex:
+    """Префиксный индекс названий ингредиентов в памяти процесса.
+
+    Хранит два отсортированных массива: полные названия и хвосты
+    названий, начинающиеся со второго и следующих слов. Поиск по
+    названиям идёт первым, поэтому совпадения с начала названия всегда
+    стоят выше совпадений с начала слова.
+    """
+
+    def __init__(self, rows):
+        names = []
+        words = []
+        for pk, name in rows:
+            key = normalize(name)
+            names.append((key, pk))
+            words.extend(
+                (key[match.start():], pk)
+                for match in WORD_START.finditer(key) if match.start()
+            )
+        names.sort()
+        words.sort()
+        self.name_keys = [key for key, _ in names]
+        self.name_ids = array('q', (pk for _, pk in names))
+        self.word_keys = [key for key, _ in words]
+        self.word_ids = array('q', (pk for _, pk in words))
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        return cls(queryset.values_list('id', 'name').iterator())
+
+    def __len__(self):
+        return len(self.name_keys)
+
+    def search(self, query, limit):
+        query = normalize(query)
+        found = []
+        if not query:
+            return found
+        seen = set()
+        for keys, ids in ((self.name_keys, self.name_ids),
+                          (self.word_keys, self.word_ids)):
+            position = bisect_left(keys, query)
+            while (len(found) < limit and position < len(keys)
+                   and keys[position].startswith(query)):
+                pk = ids[position]
+                if pk not in seen:
+                    seen.add(pk)
+                    found.append(pk)
+                position += 1
+        return found
+
+
+def get_index(version):
+    """Индекс для версии данных version.
+
+    Перестраивается вне запросов, которые его читают: пока один поток
+    строит новый индекс, остальные отвечают по старому. Ждать приходится
+    только при первом построении.
+    """
+    global _index
+    current = _index
+    if current is not None and current[0] == version:
+        return current[1]
+    if not _lock.acquire(blocking=current is None):
+        return current[1]
+    try:
+        current = _index
+        if current is None or current[0] != version:
+            current = (version, IngredientIndex.from_queryset(
+                Ingredient.objects.all()
+            ))
+            _index = current
+        return current[1]
+    finally:
+        _lock.release()
+
+
+def search_ingredients(query, version, limit=None):
+    """Возвращает ингредиенты по запросу: сначала совпадения с начала
+    названия, затем с начала любого слова.
+
+    version меняется вместе с таблицей ингредиентов, например ETag её
+    снимка; по нему процесс узнаёт, что индекс устарел.
+    """
+    if limit is None:
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+    ids = get_index(version).search(query, limit)
+    ingredients = Ingredient.objects.in_bulk(ids)
+    return [ingredients[pk] for pk in ids if pk in ingredients]
@@ -0,0 +1,79 @@
+import logging
+
+from django.db import connections
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import fulltext
+from .counters import (change_favorites_count, change_followers_count,
+                       change_recipes_count, release_user)
+from .feed import publish
+from .images import make_thumbnails
+from .models import Favorite, Follow, Recipe, User
+
+logger = logging.getLogger(__name__)
+
+# Автоматическая таблица тегов рецепта индексирована по (recipe_id, tag_id)
+# уникальным ограничением и по tag_id; фильтру по тегам нужен обратный
+# составной индекс. Таблицу создаёт автоматическая M2M, поэтому индекс
+# добавляется вне миграций.
+TAG_RECIPE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS recipe_tag_tag_recipe '
+    'ON recipes_recipe_tags (tag_id, recipe_id)'
+)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, created, raw, **kwargs):
+    if not raw and instance.image and instance.image_changed():
+        try:
+            make_thumbnails(instance.image)
+        except FileNotFoundError:
+            logger.warning('Нет файла картинки %s', instance.image.name)
+    if created and instance.author_id:
+        change_recipes_count([instance.author_id], 1)
+        publish(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    if instance.author_id:
+        change_recipes_count([instance.author_id], -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(instance, created, **kwargs):
+    if created and instance.recipe_id:
+        change_favorites_count([instance.recipe_id], 1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(instance, created, **kwargs):
+    if created:
+        change_followers_count([instance.author_id], 1)
+
+
+# У Favorite и Follow нет обработчиков удаления: иначе Django удаляет
+# их каскадом по одной строке, с UPDATE счётчика на каждую. API удаляет
+# связи через recipes.relations и сам сдвигает счётчики, админка — через
+# change_counts, а при удалении пользователя счётчики уменьшаются здесь.
+@receiver(pre_delete, sender=User)
+def user_deleting(instance, **kwargs):
+    release_user(instance)
+
+
+@receiver(post_migrate)
+def install_fulltext(sender, using, **kwargs):
+    if sender.name == 'recipes':
+        fulltext.install(connections[using])
+
+
+@receiver(post_migrate)
+def install_tag_index(sender, using, **kwargs):
+    connection = connections[using]
+    if sender.name == 'recipes' and connection.vendor in (
+        'postgresql', 'sqlite'
+    ):
+        with connection.cursor() as cursor:
+            cursor.execute(TAG_RECIPE_INDEX)
@@ -1,13 +1,16 @@
 from django.conf import settings
 from django.contrib import admin
+from recipes.counters import change_counts, change_followers_count
 from recipes.models import Follow, User
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'email', 'username', 'first_name', 'last_name')
+    list_display = ('pk', 'email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     list_filter = ('username', 'email')
+    readonly_fields = ('recipes_count', 'followers_count')
     empty_value_display = settings.EMPTY_VALUE
 
 
@@ -17,3 +20,12 @@ class SubscriptionAdmin(admin.ModelAdmin):
     search_fields = ('user', 'author')
     list_filter = ('user', 'author')
     empty_value_display = settings.EMPTY_VALUE
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        change_followers_count([obj.author_id], -1)
+
+    def delete_queryset(self, request, queryset):
+        author_ids = list(queryset.values_list('author_id', flat=True))
+        super().delete_queryset(request, queryset)
+        change_counts(change_followers_count, author_ids, -1)